@@ -5,14 +5,21 @@ __email__ = 'a@shepetko.com'
 __license__ = 'MIT'
 
 # Public API
-from ._api import register_driver, get_driver, get_drivers, find
+from ._api import register_driver, get_driver, get_drivers, find, get_importer, normalize_link, link_hash, \
+    find_existing_links
 from . import _driver as driver, _model as model, _error as error
 
 
+def _create_driver(module: str, cls: str):
+    from importlib import import_module
+
+    return getattr(import_module(module, __name__), cls)()
+
+
 def plugin_load():
     from pytsite import lang, events
     from plugins import permissions, odm
-    from . import _model, _api, _driver, _eh
+    from . import _model, _api, _eh
 
     # Resources
     lang.register_package(__name__)
@@ -22,23 +29,48 @@ def plugin_load():
 
     # ODM models
     odm.register_model('content_import', _model.ContentImport)
+    odm.register_model('content_import_item', _model.QueuedItem)
 
     # Event handlers
     events.listen('odm@model.setup_fields', _eh.odm_model_setup_fields)
     events.listen('odm@model.setup_indexes', _eh.odm_model_setup_indexes)
 
-    # RSS import driver
-    _api.register_driver(_driver.RSS())
+    # Import drivers, they are created on first use
+    _api.register_driver('rss', lambda: _create_driver('._rss', 'RSS'))
+    _api.register_driver('atom', lambda: _create_driver('._atom', 'Atom'))
+    _api.register_driver('json_feed', lambda: _create_driver('._json_feed', 'JSONFeed'))
+
+
+def plugin_update(v_from: str):
+    from . import _migrate
+
+    # Imported content is deduplicated by hashes of source links since 2.12
+    if _migrate.parse_version(v_from) < (2, 12):
+        _migrate.link_hashes()
+
+
+def plugin_load_console():
+    from pytsite import console
+    from . import _cc
+
+    # Console commands
+    console.register_command(_cc.Bench())
+    console.register_command(_cc.Backfill())
+    console.register_command(_cc.Worker())
 
 
 def plugin_load_uwsgi():
     from pytsite import router, cron
     from plugins import admin
-    from . import _eh
+    from . import _eh, _controllers
 
     # Cron tasks
     cron.every_min(_eh.cron_1min)
 
+    # Routes
+    router.handle(_controllers.Metrics, '/content_import/metrics', 'content_import@metrics')
+    router.handle(_controllers.WebSub, '/content_import/websub/<uid>', 'content_import@websub', methods=('GET', 'POST'))
+
     # Sidebar menu
     m = 'content_import'
     admin.sidebar.add_menu(sid='content', mid=m, title=__name__ + '@import',
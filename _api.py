@@ -4,34 +4,76 @@ __author__ = 'Oleksandr Shepetko'
 __email__ = 'a@shepetko.com'
 __license__ = 'MIT'
 
-from typing import Dict as _Dict
+import re as _re
+import threading as _threading
+from hashlib import sha1 as _sha1
+from typing import Callable as _Callable, Dict as _Dict, Iterable as _Iterable, Optional as _Optional, Set as _Set, \
+    Union as _Union
+from urllib.parse import urlsplit as _urlsplit, urlunsplit as _urlunsplit, parse_qsl as _parse_qsl, \
+    urlencode as _urlencode
 from frozendict import frozendict as _frozendict
-from pytsite import lang as _lang
-from plugins import odm as _odm
+from pytsite import lang as _lang, reg as _reg
+from plugins import odm as _odm, content as _content
 from . import _driver, _error
 
+_TRACKING_PARAMS_RE = _re.compile('^(utm_\\w+|fbclid|gclid|yclid|_openstat|mc_cid|mc_eid)$')
+_DEFAULT_PORTS = {'http': ':80', 'https': ':443'}
+
 _drivers = {}  # type: _Dict[str, _driver.Abstract]
+_factories = {}  # type: _Dict[str, _Callable[[], _driver.Abstract]]
+_drivers_lock = _threading.RLock()
 
 
-def register_driver(driver: _driver.Abstract):
+def register_driver(driver: _Union[str, _driver.Abstract], factory: _Callable[[], _driver.Abstract] = None):
     """Register a content import driver.
+
+    Driver may be registered by name and factory; in this case it is created on first use.
+    """
+    if isinstance(driver, str):
+        if not callable(factory):
+            raise TypeError('Driver factory must be callable')
+        with _drivers_lock:
+            _factories[driver] = factory
+            _drivers.pop(driver, None)
+    else:
+        with _drivers_lock:
+            _drivers[driver.get_name()] = driver
+            _factories.pop(driver.get_name(), None)
+
+
+def _resolve(driver_name: str) -> _driver.Abstract:
+    """Create a driver registered by factory.
+
+    Factory is removed only after it created the driver, so a failed factory may be called again later.
     """
-    _drivers[driver.get_name()] = driver
+    with _drivers_lock:
+        if driver_name not in _drivers:
+            if driver_name not in _factories:
+                raise _error.DriverNotRegistered("Content import driver '{}' is not registered.".format(driver_name))
+
+            _drivers[driver_name] = _factories[driver_name]()
+            del _factories[driver_name]
+
+        return _drivers[driver_name]
 
 
 def get_drivers() -> _Dict[str, _driver.Abstract]:
     """Get all the registered drivers.
     """
+    for driver_name in list(_factories):
+        if driver_name not in _drivers:
+            _resolve(driver_name)
+
     return _frozendict(_drivers)
 
 
 def get_driver(driver_name: str) -> _driver.Abstract:
     """Get a content import driver by name.
     """
-    if driver_name not in _drivers:
-        raise _error.DriverNotRegistered("Content import driver '{}' is not registered.")
+    driver = _drivers.get(driver_name)
 
-    return _drivers[driver_name]
+    # Not created yet driver is looked up again under the lock, because another thread may be creating it right now
+    return driver if driver else _resolve(driver_name)
 
 
 def find(content_language: str = None) -> _odm.Finder:
@@ -45,3 +87,62 @@ def find(content_language: str = None) -> _odm.Finder:
         f.eq('content_language', content_language)
 
     return f
+
+
+def get_importer(uid: str) -> _Optional[_odm.model.Entity]:
+    """Get an importer by its UID.
+    """
+    return _odm.find('content_import').eq('_id', uid).first()
+
+
+def normalize_link(link: str) -> str:
+    """Normalize a link, so its variants with different scheme, tracking parameters, etc. are equal.
+    """
+    parts = _urlsplit(link.strip())
+    scheme = parts.scheme.lower()
+
+    netloc = parts.netloc.lower()
+    if scheme in _DEFAULT_PORTS and netloc.endswith(_DEFAULT_PORTS[scheme]):
+        netloc = netloc[:-len(_DEFAULT_PORTS[scheme])]
+
+    query = sorted((k, v) for k, v in _parse_qsl(parts.query, True) if not _TRACKING_PARAMS_RE.match(k))
+
+    return _urlunsplit(('', netloc, parts.path.rstrip('/') or '/', _urlencode(query), ''))
+
+
+def link_hash(link: str, language: str) -> str:
+    """Get hash of a normalized link.
+    """
+    return _sha1('{} {}'.format(language, normalize_link(link)).encode('utf-8')).hexdigest()
+
+
+def find_existing_links(content_model: str, language: str, links: _Iterable[str]) -> _Set[str]:
+    """Get links which were already imported.
+    """
+    hashes = {}
+    for link in links:
+        hashes.setdefault(link_hash(link, language), []).append(link)
+
+    if not hashes:
+        return set()
+
+    f = _content.find(content_model, status='*', check_publish_time=False, language=language)
+    existing = set()
+    for h in f.inc('content_import.source_link_hash', list(hashes)).distinct('content_import.source_link_hash'):
+        existing.update(hashes.get(h, ()))
+
+    # Near-duplicates which were skipped or merged into content imported from other sources
+    rest = [h for h in hashes if not existing.issuperset(hashes[h])]
+    if rest:
+        f = _content.find(content_model, status='*', check_publish_time=False, language=language)
+        f.inc('content_import.duplicate_link_hashes', rest)
+        for h in f.distinct('content_import.duplicate_link_hashes'):
+            existing.update(hashes.get(h, ()))
+
+    # Content which was imported before links hashing was introduced and was not migrated
+    rest = [link for links in hashes.values() for link in links if link not in existing]
+    if rest and _reg.get('content_import.legacy_dedup', False):
+        f = _content.find(content_model, status='*', check_publish_time=False, language=language)
+        existing.update(set(f.inc('ext_links', rest).distinct('ext_links')).intersection(rest))
+
+    return existing
@@ -0,0 +1,85 @@
+"""PytSite Content Import Plugin Atom Driver
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+from typing import Optional as _Optional
+from xml.etree import ElementTree as _ElementTree
+from pytsite import lang as _lang
+from . import _driver, _feed
+
+_A = _feed.ATOM_NS
+
+
+def _get_text(el: _Optional[_ElementTree.Element]) -> _Optional[str]:
+    """Get content of an Atom text construct.
+    """
+    if el is None:
+        return None
+
+    # XHTML content is wrapped into a div, which is not a part of the content
+    if el.get('type') == 'xhtml':
+        div = el.find('{http://www.w3.org/1999/xhtml}div')
+        if div is None:
+            return el.text
+
+        # Namespaces are not welcome in HTML
+        for child in div.iter():
+            child.tag = child.tag.split('}', 1)[-1]
+
+        return (div.text or '') + ''.join(_ElementTree.tostring(c, 'unicode') for c in div)
+
+    return el.text
+
+
+class Atom(_feed.XMLFeed):
+    """Atom Content Import Driver.
+    """
+    _item_tag = _A + 'entry'
+
+    def get_name(self) -> str:
+        """Get name of the driver.
+        """
+        return 'atom'
+
+    def get_description(self) -> str:
+        """Get the human readable description of the driver.
+        """
+        return _lang.t('content_import@atom')
+
+    def _get_item(self, entry: _ElementTree.Element) -> _driver.Item:
+        """Convert an Atom entry element to an item.
+        """
+        link = None
+        enclosures = []
+        for el in entry.findall(_A + 'link'):
+            rel = el.get('rel', 'alternate')
+            if rel == 'alternate' and not link:
+                link = el.get('href')
+            elif rel == 'enclosure' and el.get('href'):
+                enclosures.append((el.get('href'), el.get('type')))
+
+        # Author is formatted like RSS one, i. e. 'email (name)'
+        author = None
+        author_el = entry.find(_A + 'author')
+        if author_el is not None:
+            name, email = author_el.findtext(_A + 'name'), author_el.findtext(_A + 'email')
+            author = '{} ({})'.format(email, name) if email and name else email or name
+
+        pub_date = entry.findtext(_A + 'published') or entry.findtext(_A + 'updated')
+
+        return _driver.Item(
+            guid=entry.findtext(_A + 'id'),
+            link=link,
+            title=_get_text(entry.find(_A + 'title')),
+            pub_date=pub_date,
+            pub_ts=_feed.get_timestamp(pub_date),
+            description=_get_text(entry.find(_A + 'summary')),
+            body=_get_text(entry.find(_A + 'content')),
+            author=author,
+            categories=[c.get('label') or c.get('term') for c in entry.findall(_A + 'category') if c.get('term')],
+            tags=[t.text for t in entry.findall('{https://pytsite.xyz}tag') if t.text],
+            video_links=_feed.get_video_links(entry),
+            enclosures=enclosures,
+        )
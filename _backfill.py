@@ -0,0 +1,123 @@
+"""PytSite Content Import Plugin Backfill
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+from datetime import datetime as _datetime
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from typing import Callable as _Callable, List as _List, Tuple as _Tuple
+from frozendict import frozendict as _frozendict
+from pytsite import reg as _reg, logger as _logger
+from . import _api, _driver, _error, _lease, _model, _pipeline, _throttle
+
+
+def _save_chunk(importer: _model.ContentImport, driver: _driver.Abstract, items: _List[_driver.Item],
+                options: _frozendict, limiter: _throttle.TokenBucket) -> _Tuple[int, int]:
+    """Build and save entities of a chunk of items.
+    """
+    entities = driver.build_entities(items, options)
+    limiter.wait(len(entities))
+
+    return _pipeline.save(importer, driver, entities)
+
+
+def run(importer: _model.ContentImport, driver_name: str = None, driver_opts: dict = None, workers: int = None,
+        rate: float = None, restart: bool = False, progress: _Callable[[dict], None] = None,
+        local: bool = False) -> dict:
+    """Import all source's items, ignoring the per-run items limit.
+
+    Progress is stored in importer's `backfill` field after each chunk of items, as the cursor of the current page and
+    offset of the chunk within it, so an interrupted backfill continues from the chunk where it stopped. Importer is
+    leased while the backfill runs, so it is not run by cron or pushes at the same time. Source may be read from local
+    files only if `local` is set.
+    """
+    driver_name = driver_name or importer.driver
+    driver_opts = dict(importer.driver_opts if driver_opts is None else driver_opts)
+    workers = workers or _reg.get('content_import.backfill_workers', 4)
+    limiter = _throttle.TokenBucket(rate if rate is not None else _reg.get('content_import.backfill_rate', 10))
+    chunk_size = _reg.get('content_import.dedup_batch_size', 10)
+
+    driver = _api.get_driver(driver_name)
+    if _driver.is_legacy(driver):
+        raise _error.ContentImportError("Content import driver '{}' does not support backfill".format(driver_name))
+
+    options = _frozendict(_pipeline.get_options(importer, driver_opts))
+
+    # Progress of another source cannot be resumed
+    bf = dict(importer.backfill or {})
+    if restart or bf.get('driver') != driver_name or dict(bf.get('driver_opts') or {}) != driver_opts:
+        bf = {
+            'driver': driver_name,
+            'driver_opts': driver_opts,
+            'cursor': None,
+            'offset': 0,
+            'pages': 0,
+            'items': 0,
+            'imported': 0,
+            'failed': 0,
+            'started_at': _datetime.now(),
+            'finished_at': None,
+        }
+    elif bf.get('finished_at'):
+        return bf
+
+    # Importer may be run by another node or worker right now
+    leased = _lease.acquire(importer)
+    if not leased:
+        raise _error.ContentImportError("Content import '{}' is running, try again later".format(importer.ref))
+
+    try:
+        bf = _run(leased, driver, options, bf, workers, limiter, chunk_size, progress, local)
+    finally:
+        _lease.release(leased)
+
+    _logger.info("Backfill of content import '{}' finished. Entities imported: {}".format(importer.ref,
+                                                                                        bf['imported']))
+
+    return bf
+
+
+def _run(importer: _model.ContentImport, driver: _driver.Abstract, options: _frozendict, bf: dict, workers: int,
+         limiter: _throttle.TokenBucket, chunk_size: int, progress: _Callable[[dict], None], local: bool) -> dict:
+    """Import source's pages and chunks which were not processed yet.
+    """
+    def store():
+        # Backfill may last longer than a lease
+        if not _lease.extend(importer):
+            raise _error.ContentImportError("Lease of content import '{}' was lost".format(importer.ref))
+
+        bf['updated_at'] = _datetime.now()
+        importer.f_set('backfill', bf)
+        importer.save()
+
+        if progress:
+            progress(bf)
+
+    with _ThreadPoolExecutor(workers, 'content_import_backfill') as executor:
+        for cursor, items in driver.get_pages(options, bf['cursor'], local):
+            # Items of the current page which were processed before the backfill was interrupted
+            offset = bf.setdefault('offset', 0)
+            chunks = [items[i:i + chunk_size] for i in range(offset, len(items), chunk_size)]
+
+            # Chunks are saved in parallel, but their results are taken in order, so the offset never skips a chunk
+            results = executor.map(lambda c: _save_chunk(importer, driver, c, options, limiter), chunks)
+            for chunk, (saved, failed) in zip(chunks, results):
+                bf['imported'] += saved
+                bf['failed'] += failed
+                bf['items'] += len(chunk)
+                bf['offset'] += len(chunk)
+                store()
+
+            bf.update({
+                'cursor': cursor,
+                'offset': 0,
+                'pages': bf['pages'] + 1,
+            })
+            store()
+
+    bf['finished_at'] = _datetime.now()
+    importer.f_set('backfill', bf)
+    importer.save()
+
+    return bf
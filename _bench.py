@@ -0,0 +1,249 @@
+"""PytSite Content Import Plugin Benchmarks
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import threading as _threading
+import tracemalloc as _tracemalloc
+from base64 import b64decode as _b64decode
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from email.utils import formatdate as _formatdate
+from http.server import HTTPServer as _HTTPServer, BaseHTTPRequestHandler as _BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn as _ThreadingMixIn
+from time import time as _time, perf_counter as _perf_counter
+from typing import Dict as _Dict, List as _List, Tuple as _Tuple
+from xml.sax.saxutils import escape as _escape
+from frozendict import frozendict as _frozendict
+from pytsite import util as _util
+from plugins import tag as _tag
+from . import _api, _cache, _images, _metrics, _model, _pipeline, _throttle
+
+VARIANTS = ('plain', 'media', 'yandex', 'encoded', 'enclosure')
+
+_PNG = _b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+
+_NAMESPACES = {
+    'plain': '',
+    'media': ' xmlns:media="http://search.yahoo.com/mrss/"',
+    'yandex': ' xmlns:yandex="http://news.yandex.ru"',
+    'encoded': ' xmlns:content="http://purl.org/rss/1.0/modules/content/"',
+    'enclosure': '',
+}
+
+
+def generate_rss(variant: str, base_url: str, prefix: str, items: int, tags: int, categories: int) -> bytes:
+    """Generate an RSS feed.
+    """
+    body = '<p>{}</p>'.format('Lorem ipsum dolor sit amet. ' * 50)
+    xml_items = []
+    for i in range(items):
+        link = '{}/{}/{}'.format(base_url, prefix, i)
+        parts = [
+            '<title>Item {} of {}</title>'.format(i, prefix),
+            '<link>{}</link>'.format(link),
+            '<guid>{}</guid>'.format(link),
+            '<pubDate>{}</pubDate>'.format(_formatdate(_time() - i * 60)),
+            '<description>{}</description>'.format(_escape(body[:500])),
+            '<author>author@example.com (Author {})</author>'.format(i % 10),
+        ]
+        parts += ['<category>Category {}</category>'.format(c) for c in range(categories)]
+        parts += ['<pytsite:tag>Tag {}</pytsite:tag>'.format((i + t) % 100) for t in range(tags)]
+
+        if variant == 'media':
+            parts.append('<media:group><media:player url="{}/video/{}"/></media:group>'.format(base_url, i))
+        elif variant == 'yandex':
+            parts.append('<yandex:full-text>{}</yandex:full-text>'.format(_escape(body)))
+        elif variant == 'encoded':
+            parts.append('<content:encoded>{}</content:encoded>'.format(_escape(body)))
+        elif variant == 'enclosure':
+            parts.append('<enclosure url="{}/img/{}.png" type="image/png"/>'.format(base_url, i % 20))
+
+        xml_items.append('<item>{}</item>'.format(''.join(parts)))
+
+    return '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0" xmlns:pytsite="https://pytsite.xyz"{}>' \
+           '<channel><title>{}</title><link>{}</link>{}</channel></rss>' \
+        .format(_NAMESPACES[variant], prefix, base_url, ''.join(xml_items)).encode('utf-8')
+
+
+class _Server(_ThreadingMixIn, _HTTPServer):
+    daemon_threads = True
+
+
+class FixturesServer:
+    """Local HTTP server which serves generated fixtures.
+    """
+
+    def __init__(self):
+        """Init.
+        """
+        self._fixtures = {}  # type: _Dict[str, _Tuple[str, bytes]]
+
+        fixtures = self._fixtures
+
+        class Handler(_BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path.startswith('/img/'):
+                    content_type, body = 'image/png', _PNG
+                elif path in fixtures:
+                    content_type, body = fixtures[path]
+                else:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = _Server(('127.0.0.1', 0), Handler)
+        self._thread = _threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        """Get base URL of the server.
+        """
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def add(self, path: str, content_type: str, body: bytes) -> str:
+        """Add a fixture, return its URL.
+        """
+        self._fixtures[path] = (content_type, body)
+
+        return self.base_url + path
+
+    def start(self):
+        """Start the server.
+
+        Requests to the server are not throttled, so the benchmark measures the pipeline, not the rate limiter.
+        """
+        _throttle.exempt(_throttle.get_domain(self.base_url))
+        self._thread.start()
+
+    def stop(self):
+        """Stop the server.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        _throttle.exempt(_throttle.get_domain(self.base_url), False)
+
+
+def _count_queries(importer: _model.ContentImport) -> int:
+    """Get number of operations performed by the database server so far.
+    """
+    counters = importer.collection.database.command('serverStatus')['opcounters']
+
+    return sum(counters[k] for k in ('query', 'getmore', 'command', 'insert', 'update', 'delete'))
+
+
+def _find_tags(titles: _List[str], language: str) -> _List[_tag.model.Tag]:
+    """Find existing tags by titles.
+    """
+    return [t for t in (_tag.find_by_title(title, language=language) for title in titles) if t]
+
+
+def run(importer: _model.ContentImport, variant: str, items: int, importers: int, tags: int, categories: int,
+        save: bool, server: FixturesServer) -> dict:
+    """Run a single benchmark.
+
+    Importer is used as a source of content settings only, it is never modified. Entities, images and tags which are
+    created by the benchmark are deleted after it. Time of each pipeline stage is summed over all importers' threads.
+    """
+    driver = _api.get_driver('rss')
+    prefix = '{}-{}-{}-{}'.format(variant, items, importers, _util.random_str(8))
+    urls = []
+    bytes_total = 0
+    for i in range(importers):
+        body = generate_rss(variant, server.base_url, '{}-{}'.format(prefix, i), items, tags, categories)
+        urls.append(server.add('/{}-{}.xml'.format(prefix, i), 'application/rss+xml', body))
+        bytes_total += len(body)
+
+    stages = {s: 0.0 for s in _metrics.STAGES}
+    saved = []
+    lock = _threading.Lock()
+
+    def run_one(url: str):
+        options = _frozendict({
+            'url': url,
+            'content_author': importer.content_author,
+            'content_model': importer.content_model,
+            'content_language': importer.content_language,
+            'content_status': importer.content_status,
+            'content_section': importer.content_section,
+        })
+
+        # Stages are measured by the pipeline itself, separately in each thread
+        with _metrics.measure() as m:
+            entities = list(driver.get_entities(options, {}))
+            if save:
+                _pipeline.save(importer, driver, entities)
+
+        with lock:
+            for s in _metrics.STAGES:
+                stages[s] += m.stages[s]
+            saved.extend(entities)
+
+    tag_titles = ['Tag {}'.format(t) for t in range(min(items + tags, 100))] if tags else []
+    tags_before = {t.id for t in _find_tags(tag_titles, importer.content_language)}
+
+    queries_before = _count_queries(importer)
+    _tracemalloc.start()
+    started = _perf_counter()
+    try:
+        with _ThreadPoolExecutor(importers) as executor:
+            list(executor.map(run_one, urls))
+        elapsed = _perf_counter() - started
+        peak_memory = _tracemalloc.get_traced_memory()[1]
+    finally:
+        _tracemalloc.stop()
+
+    # Subtract the 'serverStatus' command itself
+    queries = _count_queries(importer) - queries_before - 1
+
+    for entity in saved:
+        if not entity.is_new:
+            entity.delete()
+        elif entity.has_field('images'):
+            _images.discard(entity.images)
+
+    for tag in _find_tags(tag_titles, importer.content_language):
+        if tag.id not in tags_before:
+            tag.delete()
+
+    # Lookup cache must not keep deleted tags
+    _cache.clear()
+
+    return {
+        'variant': variant,
+        'items': items,
+        'importers': importers,
+        'tags': tags,
+        'categories': categories,
+        'save': save,
+        'bytes': bytes_total,
+        'entities': len(saved),
+        'elapsed': elapsed,
+        'items_per_sec': len(saved) / elapsed if elapsed else 0,
+        'queries': queries,
+        'queries_per_item': queries / len(saved) if saved else 0,
+        'peak_memory': peak_memory,
+        'stages': stages,
+    }
+
+
+def run_all(importer: _model.ContentImport, variants: _List[str], items: _List[int], importers: _List[int],
+            tags: int, categories: int, save: bool) -> _List[dict]:
+    """Run benchmarks for all combinations of arguments.
+    """
+    server = FixturesServer()
+    server.start()
+    try:
+        return [run(importer, v, i, n, tags, categories, save, server) for v in variants for i in items
+                for n in importers]
+    finally:
+        server.stop()
@@ -0,0 +1,106 @@
+"""PytSite Content Import Plugin Lookup Caches
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import threading as _threading
+from collections import OrderedDict as _OrderedDict
+from time import monotonic as _monotonic
+from typing import Any as _Any, Optional as _Optional, Tuple as _Tuple
+from pytsite import reg as _reg
+from plugins import section as _section, tag as _tag
+
+_MISS = object()
+_MAX_SIZE = _reg.get('content_import.lookup_cache_size', 1000)
+_TTL = _reg.get('content_import.lookup_cache_ttl', 300)
+
+
+class LookupCache:
+    """Bounded LRU cache with expiring items.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        """Init.
+        """
+        self._max_size = max_size
+        self._ttl = ttl
+        self._items = _OrderedDict()
+        self._lock = _threading.Lock()
+
+    def get(self, key: _Tuple[str, str]) -> _Any:
+        """Get an item, return `_MISS` if it does not exist or expired.
+        """
+        with self._lock:
+            try:
+                value, expires = self._items[key]
+            except KeyError:
+                return _MISS
+
+            if expires < _monotonic():
+                del self._items[key]
+                return _MISS
+
+            self._items.move_to_end(key)
+
+            return value
+
+    def put(self, key: _Tuple[str, str], value: _Any):
+        """Put an item, evicting the least recently used one if necessary.
+        """
+        with self._lock:
+            self._items[key] = (value, _monotonic() + self._ttl)
+            self._items.move_to_end(key)
+
+            while len(self._items) > self._max_size:
+                self._items.popitem(False)
+
+    def clear(self):
+        """Remove all items.
+        """
+        with self._lock:
+            self._items.clear()
+
+
+_sections = LookupCache(_MAX_SIZE, _TTL)
+_tags = LookupCache(_MAX_SIZE, _TTL)
+_tags_create_lock = _threading.Lock()
+
+
+def find_section(title: str, language: str) -> _Optional[_section.model.Section]:
+    """Find a section by title.
+    """
+    key = (language, title)
+    section = _sections.get(key)
+    if section is _MISS:
+        section = _section.find_by_title(title, language=language)
+        _sections.put(key, section)
+
+    return section
+
+
+def get_tag(title: str, language: str) -> _tag.model.Tag:
+    """Find a tag by title, create it if it does not exist.
+    """
+    key = (language, title)
+    tag = _tags.get(key)
+    if tag is not _MISS:
+        return tag
+
+    # Search and creation are serialized, so concurrent importers never create the same tag twice
+    with _tags_create_lock:
+        tag = _tags.get(key)
+        if tag is _MISS:
+            tag = _tag.find_by_title(title, language=language)
+            if not tag:
+                tag = _tag.dispense(title, language=language).save()
+            _tags.put(key, tag)
+
+    return tag
+
+
+def clear():
+    """Clear all caches.
+    """
+    _sections.clear()
+    _tags.clear()
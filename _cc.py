@@ -0,0 +1,154 @@
+"""PytSite Content Import Plugin Console Commands
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import json as _json
+from time import monotonic as _monotonic, sleep as _sleep
+from datetime import datetime as _datetime
+from pytsite import console as _console, package_info as _package_info, reg as _reg
+from plugins import odm as _odm
+
+
+class Bench(_console.Command):
+    """content_import:bench
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        self.define_option(_console.option.Str('importer', required=True))
+        self.define_option(_console.option.Str('variants'))
+        self.define_option(_console.option.Str('items', default='10,100,1000'))
+        self.define_option(_console.option.Str('importers', default='1,10'))
+        self.define_option(_console.option.Int('tags', default=3, minimum=0))
+        self.define_option(_console.option.Int('categories', default=2, minimum=0))
+        self.define_option(_console.option.Bool('save', default=False))
+        self.define_option(_console.option.Str('output', default='content_import_bench.json'))
+
+    @property
+    def name(self) -> str:
+        return 'content_import:bench'
+
+    @property
+    def description(self) -> str:
+        return 'content_import@console_command_description_bench'
+
+    def exec(self):
+        from . import _bench
+
+        importer = _odm.dispense('content_import', self.opt('importer'))
+        if importer.is_new:
+            raise _console.error.CommandExecutionError("Content import '{}' not found".format(self.opt('importer')))
+
+        variants = self.opt('variants').split(',') if self.opt('variants') else list(_bench.VARIANTS)
+        for v in variants:
+            if v not in _bench.VARIANTS:
+                raise _console.error.CommandExecutionError("Unknown variant '{}'".format(v))
+
+        results = _bench.run_all(
+            importer,
+            variants,
+            [int(i) for i in self.opt('items').split(',')],
+            [int(i) for i in self.opt('importers').split(',')],
+            self.opt('tags'),
+            self.opt('categories'),
+            self.opt('save'),
+        )
+
+        for r in results:
+            _console.print_info('{variant}, {items} items, {importers} importers: {items_per_sec:.1f} items/sec, '
+                                '{queries_per_item:.2f} queries/item, {peak_memory} bytes peak memory'.format(**r))
+            _console.print_info('  ' + ', '.join('{}: {:.3f}s'.format(s, t) for s, t in r['stages'].items()))
+
+        with open(self.opt('output'), 'wt') as f:
+            _json.dump({
+                'version': _package_info.version(__package__),
+                'time': _datetime.now().isoformat(),
+                'results': results,
+            }, f, indent=2)
+
+        _console.print_success('Results saved to {}'.format(self.opt('output')))
+
+
+class Backfill(_console.Command):
+    """content_import:backfill
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        self.define_option(_console.option.Str('importer', required=True))
+        self.define_option(_console.option.Str('driver'))
+        self.define_option(_console.option.Str('driver_opts'))
+        self.define_option(_console.option.PositiveInt('workers', default=4))
+        self.define_option(_console.option.Int('rate', default=10, minimum=0))
+        self.define_option(_console.option.Bool('restart', default=False))
+        self.define_option(_console.option.Bool('local', default=False))
+
+    @property
+    def name(self) -> str:
+        return 'content_import:backfill'
+
+    @property
+    def description(self) -> str:
+        return 'content_import@console_command_description_backfill'
+
+    def exec(self):
+        from . import _backfill, _error
+
+        importer = _odm.dispense('content_import', self.opt('importer'))
+        if importer.is_new:
+            raise _console.error.CommandExecutionError("Content import '{}' not found".format(self.opt('importer')))
+
+        try:
+            driver_opts = _json.loads(self.opt('driver_opts')) if self.opt('driver_opts') else None
+        except ValueError as e:
+            raise _console.error.CommandExecutionError('Invalid driver options: {}'.format(e))
+
+        def progress(bf: dict):
+            _console.print_info('Page {pages}: {items} items read, {imported} imported, {failed} failed'.format(**bf))
+
+        try:
+            bf = _backfill.run(importer, self.opt('driver'), driver_opts, self.opt('workers'), self.opt('rate'),
+                               self.opt('restart'), progress, self.opt('local'))
+        except _error.ContentImportError as e:
+            raise _console.error.CommandExecutionError(str(e))
+
+        _console.print_success('Backfill finished: {items} items read, {imported} imported, {failed} failed'
+                               .format(**bf))
+
+
+class Worker(_console.Command):
+    """content_import:worker
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        self.define_option(_console.option.Str('stage', default='save'))
+        self.define_option(_console.option.PositiveInt('idle', default=5))
+
+    @property
+    def name(self) -> str:
+        return 'content_import:worker'
+
+    @property
+    def description(self) -> str:
+        return 'content_import@console_command_description_worker'
+
+    def exec(self):
+        from . import _pipeline
+
+        stage = self.opt('stage')
+        if stage not in ('fetch', 'save'):
+            raise _console.error.CommandExecutionError("Unknown stage '{}'".format(stage))
+
+        _console.print_info("Content import '{}' worker started".format(stage))
+
+        # Worker runs by ticks, so it takes changes of settings and leases into account regularly
+        while True:
+            deadline_at = _monotonic() + _reg.get('content_import.tick_budget', 50)
+            if not _pipeline.work(stage, deadline_at):
+                _sleep(self.opt('idle'))
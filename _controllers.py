@@ -0,0 +1,57 @@
+"""PytSite Content Import Plugin Controllers
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+from hmac import compare_digest as _compare_digest
+from pytsite import routing as _routing, http as _http, reg as _reg
+from plugins import auth as _auth
+from . import _api, _metrics
+
+
+class Metrics(_routing.Controller):
+    """Importers metrics in Prometheus text format.
+    """
+
+    def exec(self):
+        # Metrics are available by token or to users who manage importers only
+        token = _reg.get('content_import.metrics_token')
+        if not (token and _compare_digest(str(self.request.inp.get('token', '')), token)):
+            user = _auth.get_current_user()
+            if not (user.is_admin or user.has_permission('odm_auth@modify.content_import')):
+                raise self.forbidden()
+
+        return _http.Response(_metrics.export(_api.find('*').get()), 200,
+                              content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class WebSub(_routing.Controller):
+    """WebSub subscriber's callback.
+    """
+
+    def exec(self):
+        from . import _pipeline, _websub
+
+        importer = _api.get_importer(self.arg('uid'))
+        if not importer:
+            raise self.not_found()
+
+        # Verification of intent
+        if self.request.method == 'GET':
+            inp = self.request.inp
+            if not _websub.verify(importer, inp.get('hub.mode'), inp.get('hub.topic'), inp.get('hub.lease_seconds')):
+                raise self.not_found()
+
+            return _http.Response(inp.get('hub.challenge', ''), 200, content_type='text/plain')
+
+        # Content distribution; hub must not know whether the signature is valid
+        body = self.request.get_data()
+        if not _websub.check_signature(importer, body, self.request.headers.get('X-Hub-Signature')):
+            return _http.Response('', 202)
+
+        # Importer is busy or content was not imported, so hub should retry delivery later
+        if not _pipeline.push(importer, body):
+            return _http.Response('', 503)
+
+        return _http.Response('', 202)
@@ -4,14 +4,78 @@ __author__ = 'Oleksandr Shepetko'
 __email__ = 'a@shepetko.com'
 __license__ = 'MIT'
 
-import re as _re
 from abc import ABC as _ABC, abstractmethod as _abstractmethod
-from typing import Iterable as _Iterable, Tuple as _Tuple
+from functools import lru_cache as _lru_cache
+from typing import Iterable as _Iterable, Iterator as _Iterator, Optional as _Optional, List as _List, \
+    Tuple as _Tuple
 from frozendict import frozendict as _frozendict
 from urllib.parse import urlparse
-from pytsite import lang as _lang, validation as _validation, util as _util
-from plugins import content as _content, section as _section, tag as _tag, feed as _feed, file as _file, \
-    widget as _widget
+from pytsite import reg as _reg, logger as _logger
+from plugins import content as _content
+from . import _api, _metrics
+
+_REQUIRED_FIELDS = ('author', 'status', 'language', 'title', 'publish_time', 'ext_links', 'section')
+
+
+@_lru_cache()
+def _check_model(model: str) -> bool:
+    """Check if a content model defines all the fields which are necessary to import content.
+    """
+    entity_mock = _content.dispense(model)
+    for f_name in _REQUIRED_FIELDS:
+        if not entity_mock.has_field(f_name):
+            raise RuntimeError("Model '{}' doesn't define field '{}'".format(model, f_name))
+
+    return True
+
+
+class Item:
+    """Lightweight representation of a source's item.
+    """
+    __slots__ = ('guid', 'link', 'title', 'pub_date', 'pub_ts', 'description', 'body', 'author', 'categories', 'tags',
+                 'video_links', 'enclosures')
+
+    def __init__(self, guid: str = None, link: str = None, title: str = None, pub_date: str = None,
+                 pub_ts: float = None, description: str = None, body: str = None, author: str = None,
+                 categories: _List[str] = None, tags: _List[str] = None, video_links: _List[str] = None,
+                 enclosures: _List[_Tuple[str, str]] = None):
+        """Init.
+
+        `pub_date` is a date/time string as it is published by the source, `pub_ts` is its POSIX timestamp if it can
+        be cheaply parsed. `enclosures` is a list of (URL, MIME type) tuples.
+        """
+        self.guid = guid or link
+        self.link = link
+        self.title = title
+        self.pub_date = pub_date
+        self.pub_ts = pub_ts
+        self.description = description
+        self.body = body
+        self.author = author
+        self.categories = categories or []
+        self.tags = tags or []
+        self.video_links = video_links or []
+        self.enclosures = enclosures or []
+
+    def as_dict(self) -> dict:
+        """Get dict representation of the item.
+        """
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Create an item from its dict representation.
+        """
+        data = dict(data)
+        data['enclosures'] = [tuple(e) for e in data.get('enclosures', ())]
+
+        return cls(**data)
+
+
+def is_legacy(driver: 'Abstract') -> bool:
+    """Check if a driver implements only the legacy get_entities(options) interface.
+    """
+    return type(driver).get_items is Abstract.get_items
 
 
 class Abstract(_ABC):
@@ -36,140 +100,294 @@ class Abstract(_ABC):
         """
         pass
 
-    @_abstractmethod
-    def get_entities(self, options: _frozendict) -> _Iterable[_content.model.Content]:
-        pass
+    def get_items(self, options: _frozendict, state: dict) -> _Iterable[Item]:
+        """Get source's items, newest first.
 
+        `state` is a mutable dict which is kept between runs of the same importer. It is stored only after all the
+        source's entities were processed.
 
-class RSS(Abstract):
-    """RSS Content Import Driver.
-    """
+        Drivers which do not override this method must override get_entities(options) and are run the legacy way,
+        without state, checkpoints, deduplication and backfill.
+        """
+        return ()
 
-    def get_name(self) -> str:
-        """Get name of the driver.
+    def get_pages(self, options: _frozendict, cursor: str = None, local: bool = False) \
+            -> _Iterable[_Tuple[_Optional[str], _List[Item]]]:
+        """Get all source's items for backfill, page by page.
+
+        Yields tuples of a cursor to resume reading after the page and page's items. Sources which do not support
+        paging are read as a single page. Sources may be read from local files only if `local` is set.
         """
-        return 'rss'
+        yield None, list(self.get_items(options, {}))
 
-    def get_description(self) -> str:
-        """Get the human readable description of the driver.
+    def build_entities(self, items: _List[Item], options: _frozendict) -> _List[_content.model.Content]:
+        """Build entities from items which were not imported yet.
         """
-        return _lang.t('content_import@rss')
+        return [entity for item, entity in self.build_item_entities(items, options)]
 
-    def get_settings_widget(self, driver_opts: _frozendict):
-        """Add widgets to the settings form of the driver.
+    def build_item_entities(self, items: _List[Item], options: _frozendict) \
+            -> _List[_Tuple[Item, _content.model.Content]]:
+        """Build entities from items which were not imported yet, return them along with their items.
         """
-        return _widget.input.Text(
-            uid='driver_opts_url',
-            label=_lang.t('content_import@url'),
-            value=driver_opts.get('url', ''),
-            rules=_validation.rule.Url(),
-            required=True,
-        )
+        _check_model(options['content_model'])
+
+        return list(self._build_batch(self._dedup(items, options), options))
 
-    def get_entities(self, options: _frozendict) -> _Iterable[_content.model.Content]:
-        """Returns entities which should be imported.
+    def get_new_items(self, options: _frozendict, state: dict) -> _Iterable[_List[Item]]:
+        """Get batches of items which were not imported yet.
+
+        If the 'max_items' option is set, no more than max_items + 1 items are returned and the state's 'truncated' key
+        is set if the source was not walked to the end. After all the source's items were walked, a new checkpoint is
+        put to the state's 'checkpoint' key; it is stored only if all the entities were saved or given up and is
+        passed back in the 'checkpoint' option on next runs.
         """
         o = options
 
-        entity_mock = _content.dispense(o['content_model'])
-        for f_name in 'author', 'status', 'language', 'title', 'publish_time', 'ext_links', 'section':
-            if not entity_mock.has_field(f_name):
-                raise RuntimeError("Model '{}' doesn't define field '{}'".format(o['content_model'], f_name))
+        # Items which were processed by previous runs
+        checkpoint = o.get('checkpoint') or {}
+        known_guids = set(checkpoint.get('guids', ()))
+        high_water = checkpoint.get('pub_ts')
+        newest_ts, newest_guid, new_guids = high_water, checkpoint.get('guid'), []
+
+        # Items are checked for duplication by batches, so a single query made per batch
+        batch_size = _reg.get('content_import.dedup_batch_size', 10)
+        batch = []
+
+        # One more item than consumer takes is returned to let it know that the source is not exhausted
+        limit = o.get('max_items')
+        taken = 0
+        items = iter(self.get_items(o, state))
+        try:
+            for item in items:
+                # Rest of the source is older than items which were already processed
+                if high_water and item.pub_ts is not None and item.pub_ts < high_water:
+                    break
+
+                if item.guid in known_guids:
+                    continue
+
+                if item.guid:
+                    new_guids.append(item.guid)
+                if item.pub_ts is not None and (newest_ts is None or item.pub_ts > newest_ts):
+                    newest_ts, newest_guid = item.pub_ts, item.guid
+
+                batch.append(item)
+                if len(batch) == batch_size:
+                    new_items = self._dedup(batch, o, limit - taken if limit else None)
+                    batch = []
+                    if new_items:
+                        taken += len(new_items)
+                        yield new_items
+
+                    # Consumer will not take more items, so there is no need to read the source further
+                    if limit and taken > limit:
+                        state['truncated'] = True
+                        return
+
+            if batch:
+                new_items = self._dedup(batch, o, limit - taken if limit else None)
+                if new_items:
+                    yield new_items
+
+        finally:
+            if hasattr(items, 'close'):
+                items.close()
+
+        state['checkpoint'] = {
+            'pub_ts': newest_ts,
+            'guid': newest_guid,
+            'guids': (new_guids + list(checkpoint.get('guids', ())))[:_reg.get('content_import.checkpoint_size', 100)],
+        }
+
+    def get_entities(self, options: _frozendict, state: dict = None) -> _Iterable[_content.model.Content]:
+        """Get entities which should be imported.
+
+        Items are checked for duplication and filtered by get_new_items() before they become entities.
+        """
+        _check_model(options['content_model'])
+
+        batches = iter(self.get_new_items(options, {} if state is None else state))
+        try:
+            for items in batches:
+                pairs = self._build_batch(items, options)
+                try:
+                    for item, entity in pairs:
+                        yield entity
+                finally:
+                    pairs.close()
+        finally:
+            batches.close()
+
+    @staticmethod
+    def _dedup(items: _List[Item], options: _frozendict, limit: int = None) -> _List[Item]:
+        """Get items which were not imported yet from a batch.
+        """
+        with _metrics.stage('dedup'):
+            existing_links = _api.find_existing_links(options['content_model'], options['content_language'],
+                                                      [i.link for i in items if i.link])
+
+        new_items = []
+        hashes = set()
+        for item in items:
+            if item.link in existing_links:
+                continue
+
+            # Same item may be published several times with different tracking parameters
+            if item.link:
+                link_hash = _api.link_hash(item.link, options['content_language'])
+                if link_hash in hashes:
+                    continue
+                hashes.add(link_hash)
 
-        parser = _feed.rss.Parser()
-        parser.load(o['url'])
+            new_items.append(item)
 
-        items = parser.get_children('channel')[0].get_children('item')  # type: _Tuple[_feed.rss.em.Element]
-        for rss_item in items:
-            # Check for duplication
-            f = _content.find(o['content_model'], status='*', check_publish_time=False, language=o['content_language'])
-            if f.inc('ext_links', rss_item.get_children('link')[0].text).count():
+        # Items over the limit would be thrown away by the consumer
+        if limit is not None:
+            new_items = new_items[:limit + 1]
+
+        return new_items
+
+    def _build_batch(self, items: _List[Item], options: _frozendict) \
+            -> _Iterator[_Tuple[Item, _content.model.Content]]:
+        """Build entities from a batch of items which were not imported yet, yield them along with their items.
+        """
+        # Heavy modules are loaded only when a driver actually runs
+        from . import _images, _transform
+
+        # CPU-bound transformation may be done in parallel processes
+        with _metrics.stage('transform'):
+            transformed = _transform.transform_many([{
+                'title': i.title,
+                'pub_date': i.pub_date,
+                'description': i.description,
+                'body': i.body,
+                'author': i.author,
+            } for i in items])
+
+        entities = []
+        for item, data in zip(items, transformed):
+            # Item without any text cannot become an entity
+            if not data['title']:
+                _logger.warn("Item '{}' has neither title nor text, skipped".format(item.guid or item.link))
                 continue
 
-            # Dispensing new entity
-            entity = _content.dispense(o['content_model'])
-
-            # Base entity's fields
-            entity.f_set('author', o['content_author'])
-            entity.f_set('status', o['content_status'])
-            entity.f_set('language', o['content_language'])
-            entity.f_set('title', rss_item.get_children('title')[0].text)
-            entity.f_set('publish_time', _util.parse_date_time(rss_item.get_children('pubDate')[0].text))
-
-            # Description
-            if rss_item.has_children('description'):
-                entity.f_set('description', _util.strip_html_tags(rss_item.get_children('description')[0].text))
-
-            # Section
-            entity.f_set('section', o['content_section'])
-
-            # Trying to find appropriate section according to source data
-            if rss_item.has_children('category'):
-                for category in rss_item.get_children('category'):
-                    s = _section.find_by_title(category.title, language=o['content_language'])
-                    if s:
-                        entity.f_set('section', s)
-                        break
-
-            # Tags
-            if entity.has_field('tags') and rss_item.has_children('{https://pytsite.xyz}tag'):
-                for tag in rss_item.get_children('{https://pytsite.xyz}tag'):
-                    tag_obj = _tag.find_by_title(tag.text, language=o['content_language'])
-                    if not tag_obj:
-                        tag_obj = _tag.dispense(tag.text, language=o['content_language']).save()
-                    entity.f_add('tags', tag_obj)
-
-            # Video links
-            if entity.has_field('video_links') and rss_item.has_children('{http://search.yahoo.com/mrss}group'):
-                for m_group in rss_item.get_children('{http://search.yahoo.com/mrss}group'):
-                    if m_group.has_children('{http://search.yahoo.com/mrss}player'):
-                        for m_player in m_group.get_children('{http://search.yahoo.com/mrss}player'):
-                            entity.f_add('video_links', m_player.attributes['url'])
-
-            # Body
-            if entity.has_field('body'):
-                body = None
-
-                if rss_item.has_children('{https://pytsite.xyz}fullText'):
-                    body = rss_item.get_children('{https://pytsite.xyz}fullText')[0].text
-                elif rss_item.has_children('{http://purl.org/rss/1.0/modules/content}encoded'):
-                    body = rss_item.get_children('{http://purl.org/rss/1.0/modules/content}encoded')[0].text
-                elif rss_item.has_children('{http://news.yandex.ru}full-text'):
-                    body = rss_item.get_children('{http://news.yandex.ru}full-text')[0].text
-
-                if body:
-                    entity.f_set('body', body)
-
-            # Images from enclosures ONLY IF entity does not contain image links in the body
-            if entity.has_field('images') and rss_item.has_children('enclosure') and '<img' not in entity.body:
-                for enc in rss_item.get_children('enclosure'):
-                    if enc.attributes['type'].startswith('image'):
-                        entity.f_add('images', _file.create(enc.attributes['url']))
-
-            # Content source link and domain
-            if rss_item.has_children('link'):
-                rss_item_link = rss_item.get_children('link')[0].text
+            with _metrics.stage('build'):
+                entity = self._build_entity(item, data, options)
+            urls = [url for url, mime in item.enclosures if self._is_image(entity, data, mime)]
+            entities.append((item, entity, urls))
+
+        # Download images of the whole batch in parallel
+        with _metrics.stage('images'):
+            images = _images.download(url for i, e, urls in entities for url in urls)
+
+        # Same image may be shared by several entities of the batch
+        for item, entity, urls in entities:
+            for url in dict.fromkeys(urls):
+                if url in images:
+                    entity.f_add('images', images[url])
+                    _images.hold(images[url])
+
+        # Images of entities which were not taken by the consumer must be deleted
+        yielded = 0
+        try:
+            for item, entity, urls in entities:
+                yielded += 1
+                yield item, entity
+
+        finally:
+            for item, entity, urls in entities[yielded:]:
+                if entity.has_field('images'):
+                    _images.discard(entity.images)
+
+    @staticmethod
+    def _is_image(entity: _content.model.Content, data: dict, mime: str) -> bool:
+        """Check if an enclosure should be imported as entity's image.
+
+        Images from enclosures are imported ONLY IF entity does not contain image links in the body.
+        """
+        return entity.has_field('images') and not data['has_images'] and (mime or '').startswith('image')
 
-                entity.f_add('content_import', {
-                    'source_link': rss_item_link,
-                    'source_domain': urlparse(rss_item_link)[1],
-                })
+    @staticmethod
+    def _build_entity(item: Item, data: dict, options: _frozendict) -> _content.model.Content:
+        """Build an entity from an item and its transformed data.
+        """
+        from . import _cache
 
-                if entity.has_field('ext_links'):
-                    entity.f_add('ext_links', rss_item_link)
+        o = options
 
-            # Content source author
-            if rss_item.has_children('author'):
-                author = rss_item.get_children('author')[0].text
+        # Dispensing new entity
+        entity = _content.dispense(o['content_model'])
+
+        # Base entity's fields
+        entity.f_set('author', o['content_author'])
+        entity.f_set('status', o['content_status'])
+        entity.f_set('language', o['content_language'])
+        entity.f_set('title', data['title'])
+        entity.f_set('publish_time', data['publish_time'])
+
+        # Description
+        if data['description'] is not None:
+            entity.f_set('description', data['description'])
+
+        # Section
+        entity.f_set('section', o['content_section'])
+
+        # Trying to find appropriate section according to source data
+        for category in item.categories:
+            s = _cache.find_section(category, o['content_language'])
+            if s:
+                entity.f_set('section', s)
+                break
+
+        # Tags
+        if entity.has_field('tags'):
+            for tag in item.tags:
+                entity.f_add('tags', _cache.get_tag(tag, o['content_language']))
+
+        # Video links
+        if entity.has_field('video_links'):
+            for video_link in item.video_links:
+                entity.f_add('video_links', video_link)
+
+        # Body
+        if entity.has_field('body') and item.body:
+            entity.f_set('body', item.body)
+
+        # Fingerprint to detect near-duplicates published by other sources
+        entity.f_add('content_import', data['fingerprint'])
+
+        # Content source link and domain
+        if item.link:
+            entity.f_add('content_import', {
+                'source_guid': item.guid,
+                'source_link': item.link,
+                'source_link_hash': _api.link_hash(item.link, o['content_language']),
+                'source_domain': urlparse(item.link)[1],
+            })
+
+            if entity.has_field('ext_links'):
+                entity.f_add('ext_links', item.link)
+
+        # Content source author
+        if item.author:
+            entity.f_add('content_import', {
+                'source_author': item.author
+            })
+
+            if data['author_email']:
                 entity.f_add('content_import', {
-                    'source_author': author
+                    'source_author_email': data['author_email'],
+                    'source_author_name': data['author_name'],
                 })
 
-                match = _re.match('(\S+)\s+\((.+?)\)', author)
-                if match:
-                    entity.f_add('content_import', {
-                        'source_author_email': _validation.rule.Email(match.group(1)).validate(),
-                        'source_author_name': match.group(2)
-                    })
+        return entity
+
+
+def __getattr__(name: str):
+    """Get a driver class which is loaded on first access.
+    """
+    if name == 'RSS':
+        from ._rss import RSS
+        return RSS
 
-            yield entity
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
@@ -11,3 +11,13 @@ class DriverNotRegistered(Exception):
 
 class ContentImportError(Exception):
     pass
+
+
+class DeadlineExceeded(ContentImportError):
+    pass
+
+
+class CircuitOpen(ContentImportError):
+    def __init__(self, msg: str, retry_in: float):
+        super().__init__(msg)
+        self.retry_in = retry_in
@@ -0,0 +1,289 @@
+"""PytSite Content Import Plugin Feed Drivers Core
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import re as _re
+import requests as _requests
+from abc import abstractmethod as _abstractmethod
+from calendar import timegm as _timegm
+from io import BytesIO as _BytesIO
+from hashlib import sha1 as _sha1
+from email.utils import parsedate_to_datetime as _parsedate_to_datetime
+from tempfile import SpooledTemporaryFile as _SpooledTemporaryFile
+from xml.etree import ElementTree as _ElementTree
+from typing import Iterable as _Iterable, Iterator as _Iterator, Optional as _Optional, List as _List, \
+    Tuple as _Tuple
+from frozendict import frozendict as _frozendict
+from urllib.parse import urlparse as _urlparse, urljoin as _urljoin
+from urllib.request import url2pathname as _url2pathname
+from pytsite import lang as _lang, validation as _validation, reg as _reg
+from plugins import widget as _widget
+from . import _driver, _error, _http, _metrics
+
+_CHUNK_SIZE = 16384
+_SPOOL_SIZE = 1048576
+
+ATOM_NS = '{http://www.w3.org/2005/Atom}'
+MRSS_NS = '{http://search.yahoo.com/mrss}'
+
+_ISO_DATE_RE = _re.compile(r'^(\d{4})-(\d\d)-(\d\d)(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:\.\d+)?)?)?\s*(Z|[+-]\d\d:?\d\d)?$',
+                           _re.IGNORECASE)
+
+
+def _iter_response(r: _requests.Response) -> _Iterator[bytes]:
+    """Iterate over response's body and close the response when iteration stops.
+    """
+    try:
+        for chunk in _http.iter_content(r, _CHUNK_SIZE):
+            _metrics.count('bytes', len(chunk))
+            yield chunk
+    finally:
+        r.close()
+
+
+def _iter_file(f) -> _Iterator[bytes]:
+    """Iterate over file's content and close the file when iteration stops.
+    """
+    try:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            yield chunk
+    finally:
+        f.close()
+
+
+def _normalize_tag(tag: str) -> str:
+    """Strip trailing slash from tag's namespace, i. e. '{http://purl.org/rss/1.0/modules/content/}encoded'
+    """
+    return tag.replace('/}', '}', 1) if tag.startswith('{') else tag
+
+
+def _iter_elements(chunks: _Iterator[bytes], tag: str, head_tags: tuple = ()) -> _Iterator[_ElementTree.Element]:
+    """Incrementally parse an XML document and yield elements as soon as they are parsed.
+
+    Yielded elements are detached from the tree, so memory is freed as soon as consumer drops them. Reading of the
+    source stops when the consumer stops iteration. Elements with `head_tags` are yielded only if they precede the
+    first `tag` element.
+    """
+    parser = _ElementTree.XMLPullParser(('start', 'end'))
+    parents = []
+    in_head = True
+
+    try:
+        while True:
+            with _metrics.stage('fetch'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+
+            with _metrics.stage('parse'):
+                parser.feed(chunk)
+                events = list(parser.read_events())
+
+            for event, el in events:
+                if event == 'start':
+                    el.tag = _normalize_tag(el.tag)
+                    parents.append(el)
+                    if el.tag == tag:
+                        in_head = False
+                    continue
+
+                parents.pop()
+                if el.tag == tag or (in_head and el.tag in head_tags):
+                    if parents:
+                        parents[-1].remove(el)
+                    yield el
+
+        parser.close()
+
+    finally:
+        chunks.close()
+
+
+def get_timestamp(date: str) -> _Optional[float]:
+    """Get a POSIX timestamp from RFC 822 or ISO 8601 date/time string.
+
+    Date/time without timezone is considered as UTC.
+    """
+    if not date:
+        return None
+
+    match = _ISO_DATE_RE.match(date.strip())
+    if match:
+        year, month, day, hour, minute, second, tz = match.groups()
+        offset = 0
+        if tz and tz.upper() != 'Z':
+            tz = tz.replace(':', '')
+            offset = (1 if tz[0] == '+' else -1) * (int(tz[1:3]) * 3600 + int(tz[3:5]) * 60)
+
+        return _timegm((int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0))) - offset
+
+    try:
+        return _parsedate_to_datetime(date).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def get_video_links(el: _ElementTree.Element) -> _List[str]:
+    """Get video links of an item from its Media RSS elements.
+    """
+    r = []
+    for m_group in el.findall(MRSS_NS + 'group'):
+        for m_player in m_group.findall(MRSS_NS + 'player'):
+            if m_player.get('url'):
+                r.append(m_player.get('url'))
+
+    return r
+
+
+class Feed(_driver.Abstract):
+    """Base Feed Content Import Driver.
+
+    Feeds are fetched by URL, conditionally when possible, and parsed by subclasses incrementally.
+    """
+
+    def get_settings_widget(self, driver_opts: _frozendict):
+        """Add widgets to the settings form of the driver.
+        """
+        return _widget.input.Text(
+            uid='driver_opts_url',
+            label=_lang.t('content_import@url'),
+            value=driver_opts.get('url', ''),
+            rules=_validation.rule.Url(),
+            required=True,
+        )
+
+    @_abstractmethod
+    def _read(self, chunks: _Iterator[bytes], state: dict) -> _Iterator[_driver.Item]:
+        """Read feed's items from its body.
+
+        WebSub hub, feed's canonical URL and next page of a paged feed should be put to the state's 'websub_hub',
+        'websub_self' and 'page_next' keys.
+        """
+        pass
+
+    @staticmethod
+    def _fetch(url: str, state: dict, local: bool = False) -> _Optional[_Iterator[bytes]]:
+        """Fetch a feed, return None if it was not modified since the previous fetch.
+
+        Local dumps are read only if `local` is set.
+        """
+        if url.startswith('file://'):
+            if not local:
+                raise _error.ContentImportError('Local feeds are allowed only for backfill: {}'.format(url))
+
+            return _iter_file(open(_url2pathname(_urlparse(url).path), 'rb'))
+
+        headers = {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+
+        r = _http.get(url, headers, _reg.get('content_import.fetch_timeout', 30))
+        if r.status_code == 304:
+            r.close()
+            return None
+
+        try:
+            r.raise_for_status()
+        except _requests.HTTPError:
+            r.close()
+            raise
+
+        # WebSub hub may be advertised by headers
+        for rel in 'hub', 'self':
+            if rel in r.links:
+                state['websub_' + rel] = r.links[rel].get('url')
+
+        # Body can be streamed directly to the parser if server supports validators
+        etag, last_modified = r.headers.get('ETag'), r.headers.get('Last-Modified')
+        if etag or last_modified:
+            state.update({'etag': etag, 'last_modified': last_modified, 'body_hash': None})
+            return _iter_response(r)
+
+        # Otherwise body must be downloaded completely to compare its hash with previous one
+        body_hash = _sha1()
+        spool = _SpooledTemporaryFile(_SPOOL_SIZE)
+        for chunk in _iter_response(r):
+            body_hash.update(chunk)
+            spool.write(chunk)
+
+        if body_hash.hexdigest() == state.get('body_hash'):
+            spool.close()
+            return None
+
+        state.update({'etag': None, 'last_modified': None, 'body_hash': body_hash.hexdigest()})
+        spool.seek(0)
+
+        return _iter_file(spool)
+
+    def get_items(self, options: _frozendict, state: dict) -> _Iterable[_driver.Item]:
+        """Get feed's items.
+
+        If the 'push_body' option is set, items are read from content which was pushed by a WebSub hub.
+        """
+        if options.get('push_body') is not None:
+            chunks = _iter_file(_BytesIO(options['push_body']))
+        else:
+            with _metrics.stage('fetch'):
+                chunks = self._fetch(options['url'], state)
+
+        # Feed was not modified since previous run
+        if chunks is None:
+            return
+
+        yield from self._read(chunks, state)
+
+    def get_pages(self, options: _frozendict, cursor: str = None, local: bool = False) \
+            -> _Iterable[_Tuple[_Optional[str], _List[_driver.Item]]]:
+        """Get all feed's items for backfill, following links to next pages of paged feeds.
+
+        Cursor is the URL of the next page. Feed may be read from a local dump only if `local` is set.
+        """
+        url = cursor or options['url']
+        visited = set()
+        while url and url not in visited:
+            visited.add(url)
+
+            # Validators are not used, so the page is always read
+            state = {}
+            with _metrics.stage('fetch'):
+                chunks = self._fetch(url, state, local)
+            items = list(self._read(chunks, state)) if chunks else []
+
+            url = _urljoin(url, state['page_next']) if state.get('page_next') else None
+            yield url, items
+
+
+class XMLFeed(Feed):
+    """Base XML Feed Content Import Driver.
+
+    Items are extracted as soon as they are parsed, so reading of the feed stops as soon as enough items are taken.
+    """
+    _item_tag = None  # type: str
+
+    @_abstractmethod
+    def _get_item(self, el: _ElementTree.Element) -> _driver.Item:
+        """Convert an item's element to an item.
+        """
+        pass
+
+    def _read(self, chunks: _Iterator[bytes], state: dict) -> _Iterator[_driver.Item]:
+        """Read feed's items from its body.
+        """
+        elements = _iter_elements(chunks, self._item_tag, (ATOM_NS + 'link',))
+        try:
+            for el in elements:
+                # WebSub hub, feed's canonical URL and next page of a paged feed advertised by the feed itself
+                if el.tag == ATOM_NS + 'link':
+                    if el.get('rel') in ('hub', 'self') and el.get('href'):
+                        state['websub_' + el.get('rel')] = el.get('href')
+                    elif el.get('rel') == 'next' and el.get('href'):
+                        state['page_next'] = el.get('href')
+                    continue
+
+                yield self._get_item(el)
+        finally:
+            elements.close()
@@ -0,0 +1,84 @@
+"""PytSite Content Import Plugin Content Fingerprints
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import re as _re
+from datetime import timedelta as _timedelta
+from hashlib import md5 as _md5
+from typing import List as _List, Optional as _Optional
+from pytsite import reg as _reg, util as _util
+from plugins import odm as _odm, content as _content
+
+_BITS = 64
+_BANDS = 4
+_BAND_BITS = _BITS // _BANDS
+_WORD_RE = _re.compile(r'\w+', _re.UNICODE)
+
+
+def simhash(text: str, shingle_size: int = 1) -> int:
+    """Compute a SimHash of a text.
+    """
+    words = _WORD_RE.findall(text.lower())
+    shingles = [' '.join(words[i:i + shingle_size]) for i in range(max(len(words) - shingle_size + 1, 1))]
+
+    weights = [0] * _BITS
+    for shingle in shingles:
+        h = int.from_bytes(_md5(shingle.encode('utf-8')).digest()[:8], 'big')
+        for bit in range(_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+
+    return sum(1 << bit for bit in range(_BITS) if weights[bit] > 0)
+
+
+def get_bands(fingerprint: int) -> _List[str]:
+    """Split a fingerprint into bands.
+
+    Fingerprints which differ in less than `_BANDS` bits always share at least one band, so bands are used to find
+    similarity candidates with an index. Bands are wide enough, so each of them matches a small part of content only.
+    """
+    mask = (1 << _BAND_BITS) - 1
+
+    return ['{}:{:04x}'.format(i, fingerprint >> (i * _BAND_BITS) & mask) for i in range(_BANDS)]
+
+
+def distance(a: int, b: int) -> int:
+    """Get Hamming distance between two fingerprints.
+    """
+    return bin(a ^ b).count('1')
+
+
+def get(title: str, text: str) -> dict:
+    """Get fingerprint data to store in entity's 'content_import' field.
+
+    Fingerprint is stored as a hex string, because MongoDB does not support unsigned 64-bit integers.
+    """
+    fingerprint = simhash('{} {}'.format(title or '', _util.strip_html_tags(text or '')))
+
+    return {
+        'fingerprint': '{:016x}'.format(fingerprint),
+        'fingerprint_bands': get_bands(fingerprint),
+    }
+
+
+def find_similar(entity: _content.model.Content) -> _Optional[_content.model.Content]:
+    """Find an entity which is a near-duplicate of a given one.
+    """
+    data = entity.f_get('content_import')
+    if not data.get('fingerprint'):
+        return None
+
+    fingerprint = int(data['fingerprint'], 16)
+    max_distance = min(_reg.get('content_import.fingerprint_distance', 3), _BANDS - 1)
+    window = _reg.get('content_import.fingerprint_window', 7)
+
+    f = _content.find(entity.model, status='*', check_publish_time=False, language=entity.language)
+    f.inc('content_import.fingerprint_bands', list(data['fingerprint_bands']))
+    if window:
+        f.gte('publish_time', entity.publish_time - _timedelta(days=window))
+    f.sort([('publish_time', _odm.I_DESC)])
+
+    for candidate in f.get(_reg.get('content_import.fingerprint_candidates', 20)):
+        if distance(fingerprint, int(candidate.f_get('content_import')['fingerprint'], 16)) <= max_distance:
+            return candidate
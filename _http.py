@@ -0,0 +1,142 @@
+"""PytSite Content Import Plugin HTTP Client
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import threading as _threading
+import requests as _requests
+from time import monotonic as _monotonic
+from typing import Iterator as _Iterator, Optional as _Optional
+from contextlib import contextmanager as _contextmanager
+from requests.adapters import HTTPAdapter as _HTTPAdapter
+from pytsite import reg as _reg, package_info as _package_info
+from . import _error, _throttle
+
+try:
+    import brotli as _brotli
+except ImportError:
+    _brotli = None
+
+_session = None  # type: _Optional[_requests.Session]
+_lock = _threading.Lock()
+_local = _threading.local()
+
+
+def _get_session() -> _requests.Session:
+    """Get the session which is shared by all the plugin's requests.
+    """
+    global _session
+
+    with _lock:
+        if not _session:
+            # Connections are pooled per host and kept alive between requests
+            adapter = _HTTPAdapter(
+                pool_connections=_reg.get('content_import.http_pool_hosts', 100),
+                pool_maxsize=_reg.get('content_import.http_pool_size', 10),
+            )
+
+            session = _requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({
+                'User-Agent': 'PytSite Content Import/{}'.format(_package_info.version(__package__)),
+                'Accept-Encoding': 'gzip, deflate, br' if _brotli else 'gzip, deflate',
+            })
+            _session = session
+
+    return _session
+
+
+def get_deadline() -> _Optional[float]:
+    """Get the deadline of the current thread, as a monotonic clock value.
+    """
+    return getattr(_local, 'deadline', None)
+
+
+@_contextmanager
+def deadline(seconds: float = None, at: float = None):
+    """Limit duration of all requests made by the current thread within the context.
+    """
+    prev = get_deadline()
+    _local.deadline = at if at is not None else _monotonic() + seconds
+    try:
+        yield _local.deadline
+    finally:
+        _local.deadline = prev
+
+
+def _get_remaining(deadline_at: _Optional[float]) -> _Optional[float]:
+    """Get number of seconds remaining till a deadline.
+    """
+    if deadline_at is None:
+        return None
+
+    remaining = deadline_at - _monotonic()
+    if remaining <= 0:
+        raise _error.DeadlineExceeded('Time budget is exhausted')
+
+    return remaining
+
+
+def _get_timeout(read_timeout: _Optional[float], deadline_at: _Optional[float]) -> tuple:
+    """Get connect and read timeouts limited by a deadline.
+    """
+    connect_timeout = _reg.get('content_import.http_connect_timeout', 5)
+    if read_timeout is None:
+        read_timeout = _reg.get('content_import.http_read_timeout', 30)
+
+    remaining = _get_remaining(deadline_at)
+    if remaining is not None:
+        connect_timeout, read_timeout = min(connect_timeout, remaining), min(read_timeout, remaining)
+
+    return connect_timeout, read_timeout
+
+
+def _request(method: str, url: str, read_timeout: _Optional[float], deadline_at: _Optional[float],
+             **kwargs) -> _requests.Response:
+    """Make a request through per-domain rate limiter and circuit breaker.
+    """
+    if deadline_at is None:
+        deadline_at = get_deadline()
+
+    _throttle.acquire(url, deadline_at)
+
+    try:
+        r = _get_session().request(method, url, timeout=_get_timeout(read_timeout, deadline_at), **kwargs)
+    except (_requests.ConnectionError, _requests.Timeout):
+        _throttle.failure(url)
+        raise
+
+    # Host is overloaded or asks to slow down
+    if r.status_code == 429 or r.status_code >= 500:
+        _throttle.failure(url, r.headers.get('Retry-After'))
+    else:
+        _throttle.success(url)
+
+    return r
+
+
+def get(url: str, headers: dict = None, read_timeout: float = None, deadline_at: float = None) -> _requests.Response:
+    """Make a streamed GET request.
+
+    If `deadline_at` is not specified, the deadline of the current thread is used.
+    """
+    return _request('GET', url, read_timeout, deadline_at, headers=headers, stream=True)
+
+
+def post(url: str, data: dict, deadline_at: float = None) -> _requests.Response:
+    """Make a POST request of a form.
+    """
+    return _request('POST', url, None, deadline_at, data=data)
+
+
+def iter_content(r: _requests.Response, chunk_size: int, deadline_at: float = None) -> _Iterator[bytes]:
+    """Iterate over decompressed response's body, stop with an error if the deadline is reached.
+    """
+    if deadline_at is None:
+        deadline_at = get_deadline()
+
+    for chunk in r.iter_content(chunk_size):
+        _get_remaining(deadline_at)
+        yield chunk
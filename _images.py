@@ -0,0 +1,164 @@
+"""PytSite Content Import Plugin Images Downloader
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import threading as _threading
+from os import path as _path, unlink as _unlink, fdopen as _fdopen
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from typing import Dict as _Dict, Iterable as _Iterable, Optional as _Optional
+from pytsite import reg as _reg, util as _util, logger as _logger, cache as _cache
+from plugins import file as _file
+from . import _error, _http
+
+_CHUNK_SIZE = 65536
+
+_cache_pool = _cache.create_pool('content_import.images')
+_fresh = {}  # type: _Dict[str, list]
+_lock = _threading.Lock()
+_executor = None  # type: _Optional[_ThreadPoolExecutor]
+
+
+def _get_executor() -> _ThreadPoolExecutor:
+    """Get the pool which downloads images.
+    """
+    global _executor
+
+    with _lock:
+        if not _executor:
+            _executor = _ThreadPoolExecutor(_reg.get('content_import.image_workers', 4), 'content_import_images')
+
+    return _executor
+
+
+def _fetch(url: str, deadline_at: float = None) -> _file.model.AbstractImage:
+    """Download an image or get it from the cache.
+    """
+    key = _util.md5_hex_digest(url)
+
+    # Image is already stored by one of previous imports
+    if _cache_pool.has(key):
+        try:
+            return _file.get(_cache_pool.get(key))
+        except _file.error.FileNotFound:
+            _cache_pool.rm(key)
+
+    max_size = _reg.get('content_import.image_max_size', 10485760)
+    r = _http.get(url, read_timeout=_reg.get('content_import.image_timeout', 30), deadline_at=deadline_at)
+    with r:
+        r.raise_for_status()
+
+        if not r.headers.get('Content-Type', '').startswith('image/'):
+            raise ValueError("'{}' is not an image".format(url))
+
+        if int(r.headers.get('Content-Length', 0)) > max_size:
+            raise ValueError("Image '{}' is too large".format(url))
+
+        fd, tmp_path = _util.mk_tmp_file(subdir='content_import')
+        try:
+            size = 0
+            with _fdopen(fd, 'wb') as f:
+                for chunk in _http.iter_content(r, _CHUNK_SIZE, deadline_at):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ValueError("Image '{}' is too large".format(url))
+                    f.write(chunk)
+
+            img = _file.create(tmp_path, _path.basename(url.split('?')[0]))
+
+        finally:
+            if _path.exists(tmp_path):
+                _unlink(tmp_path)
+
+    _cache_pool.put(key, img.uid, _reg.get('content_import.image_cache_ttl', 86400))
+    # Image is not used by any saved entity yet, so it is tracked along with number of entities which hold it
+    with _lock:
+        _fresh[img.uid] = [key, 0]
+
+    return img
+
+
+def _fetch_safe(url: str, deadline_at: float = None) -> _Optional[_file.model.AbstractImage]:
+    """Download an image, log download errors instead of raising them.
+
+    Tick's time being over is not a download error, so the importer is carried over to the next tick.
+    """
+    try:
+        return _fetch(url, deadline_at)
+    except _error.DeadlineExceeded:
+        raise
+    except Exception as e:
+        _logger.warn("Error while downloading image '{}'. {}".format(url, e))
+
+
+def download(urls: _Iterable[str]) -> _Dict[str, _file.model.AbstractImage]:
+    """Download images in parallel.
+
+    Returned dict contains successfully downloaded images only. Downloads honor the deadline of the calling thread.
+    """
+    urls = list(set(urls))
+    if not urls:
+        return {}
+
+    deadline_at = _http.get_deadline()
+    futures = [(url, _get_executor().submit(_fetch_safe, url, deadline_at)) for url in urls]
+
+    images = {}
+    deadline_error = None
+    for url, future in futures:
+        try:
+            img = future.result()
+        except _error.DeadlineExceeded as e:
+            deadline_error = e
+            continue
+
+        if img:
+            images[url] = img
+
+    # Images of the batch will not be used, because the batch is imported again on next tick
+    if deadline_error:
+        discard(images.values())
+        raise deadline_error
+
+    return images
+
+
+def hold(img: _file.model.AbstractImage):
+    """Register an entity which holds an image.
+    """
+    with _lock:
+        if img.uid in _fresh:
+            _fresh[img.uid][1] += 1
+
+
+def commit(images: _Iterable[_file.model.AbstractImage]):
+    """Mark images as used by a saved entity.
+    """
+    with _lock:
+        for img in images:
+            _fresh.pop(img.uid, None)
+
+
+def discard(images: _Iterable[_file.model.AbstractImage]):
+    """Release images of an entity which will not be saved.
+
+    Image is deleted only if it is not used by any saved entity and is not held by other entities anymore.
+    """
+    for img in images:
+        with _lock:
+            fresh = _fresh.get(img.uid)
+
+            # Image is used by a saved entity
+            if not fresh:
+                continue
+
+            # Image is shared with another entity which still may be saved
+            fresh[1] -= 1
+            if fresh[1] > 0:
+                continue
+
+            del _fresh[img.uid]
+
+        _cache_pool.rm(fresh[0])
+        img.delete()
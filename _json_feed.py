@@ -0,0 +1,103 @@
+"""PytSite Content Import Plugin JSON Feed Driver
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import json as _json
+import re as _re
+from html import escape as _escape
+from typing import Iterator as _Iterator
+from pytsite import lang as _lang
+from . import _driver, _feed, _metrics
+
+_PARAGRAPHS_RE = _re.compile(r'\n\s*\n')
+
+
+def _text_to_html(text: str) -> str:
+    """Convert plain text to HTML paragraphs.
+    """
+    paragraphs = (p.strip() for p in _PARAGRAPHS_RE.split(text))
+
+    return ''.join('<p>{}</p>'.format(_escape(p).replace('\n', '<br>')) for p in paragraphs if p)
+
+
+class JSONFeed(_feed.Feed):
+    """JSON Feed Content Import Driver.
+
+    See https://jsonfeed.org/version/1.1.
+    """
+
+    def get_name(self) -> str:
+        """Get name of the driver.
+        """
+        return 'json_feed'
+
+    def get_description(self) -> str:
+        """Get the human readable description of the driver.
+        """
+        return _lang.t('content_import@json_feed')
+
+    def _read(self, chunks: _Iterator[bytes], state: dict) -> _Iterator[_driver.Item]:
+        """Read feed's items from its body.
+
+        JSON document cannot be parsed incrementally by standard library, so it is parsed completely, but items are
+        still converted one by one, as consumer takes them.
+        """
+        try:
+            with _metrics.stage('fetch'):
+                body = b''.join(chunks)
+        finally:
+            chunks.close()
+
+        with _metrics.stage('parse'):
+            feed = _json.loads(body.decode('utf-8'))
+
+        if not isinstance(feed, dict):
+            raise ValueError('Invalid JSON Feed')
+
+        # WebSub hub, feed's canonical URL and next page of a paged feed
+        for hub in feed.get('hubs') or ():
+            if str(hub.get('type', '')).lower() == 'websub' and hub.get('url'):
+                state['websub_hub'] = hub['url']
+                break
+        if feed.get('feed_url'):
+            state['websub_self'] = feed['feed_url']
+        if feed.get('next_url'):
+            state['page_next'] = feed['next_url']
+
+        for item in feed.get('items') or ():
+            yield self._get_item(item)
+
+    @staticmethod
+    def _get_item(item: dict) -> _driver.Item:
+        """Convert a JSON Feed item to an item.
+        """
+        # Version 1.1 has list of authors, version 1.0 has single author
+        authors = item.get('authors') or ([item['author']] if item.get('author') else [])
+        author = authors[0].get('name') if authors else None
+
+        enclosures = [(a['url'], a.get('mime_type')) for a in item.get('attachments') or () if a.get('url')]
+        for key in 'image', 'banner_image':
+            if item.get(key):
+                enclosures.append((item[key], 'image/*'))
+
+        pub_date = item.get('date_published') or item.get('date_modified')
+
+        # Plain text content is not HTML, so it must be escaped
+        body = item.get('content_html')
+        if not body and item.get('content_text'):
+            body = _text_to_html(item['content_text'])
+
+        return _driver.Item(
+            guid=str(item['id']) if item.get('id') is not None else None,
+            link=item.get('url') or item.get('external_url'),
+            title=item.get('title'),
+            pub_date=pub_date,
+            pub_ts=_feed.get_timestamp(pub_date),
+            description=item.get('summary'),
+            body=body,
+            author=author,
+            tags=[t for t in item.get('tags') or () if isinstance(t, str) and t],
+            enclosures=enclosures,
+        )
@@ -0,0 +1,101 @@
+"""PytSite Content Import Plugin Importers Leases
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+from os import getpid as _getpid
+from socket import gethostname as _gethostname
+from datetime import datetime as _datetime, timedelta as _timedelta
+from typing import Optional as _Optional
+from pymongo import ReturnDocument as _ReturnDocument
+from pymongo.collection import Collection as _Collection
+from pytsite import reg as _reg
+from plugins import odm as _odm
+from . import _model
+
+_OWNER = '{}:{}'.format(_gethostname(), _getpid())
+
+
+def _get_collection() -> _Collection:
+    """Get collection of the 'content_import' model.
+    """
+    return _odm.dispense('content_import').collection
+
+
+def get_owner() -> str:
+    """Get leases owner ID of the current process.
+    """
+    return _OWNER
+
+
+def claim() -> _Optional[_model.ContentImport]:
+    """Atomically claim a due importer which is not leased by anyone, including expired leases of crashed nodes.
+
+    Most overdue importers are claimed first; importers which never ran have the highest priority. Importers with active
+    WebSub subscriptions are not polled until their subscriptions have to be renewed.
+    """
+    now = _datetime.now()
+    doc = _get_collection().find_one_and_update(
+        {
+            'enabled': True,
+            'paused_till': {'$lt': now},
+            '$and': [
+                {'$or': [{'next_run_at': {'$lt': now}}, {'next_run_at': None}]},
+                {'$or': [{'lease_until': {'$lt': now}}, {'lease_until': None}]},
+                {'$or': [{'websub.renew_at': {'$lt': now}}, {'websub.renew_at': None}]},
+            ],
+        },
+        {'$set': {
+            'lease_owner': _OWNER,
+            'lease_until': now + _timedelta(seconds=_reg.get('content_import.lease_ttl', 600)),
+        }},
+        projection={'_id': True},
+        sort=[('priority_at', _odm.I_ASC), ('errors', _odm.I_ASC)],
+        return_document=_ReturnDocument.AFTER,
+    )
+
+    return _odm.dispense('content_import', str(doc['_id'])) if doc else None
+
+
+def acquire(importer: _model.ContentImport) -> _Optional[_model.ContentImport]:
+    """Atomically lease a particular importer, return None if it is leased by someone else.
+    """
+    now = _datetime.now()
+    doc = _get_collection().find_one_and_update(
+        {
+            '_id': importer.id,
+            '$or': [{'lease_until': {'$lt': now}}, {'lease_until': None}],
+        },
+        {'$set': {
+            'lease_owner': _OWNER,
+            'lease_until': now + _timedelta(seconds=_reg.get('content_import.lease_ttl', 600)),
+        }},
+        projection={'_id': True},
+        return_document=_ReturnDocument.AFTER,
+    )
+
+    return _odm.dispense('content_import', str(doc['_id'])) if doc else None
+
+
+def extend(importer: _model.ContentImport) -> bool:
+    """Extend a lease of an importer which is held by the current process, return False if it is lost.
+    """
+    lease_until = _datetime.now() + _timedelta(seconds=_reg.get('content_import.lease_ttl', 600))
+    r = _get_collection().update_one({'_id': importer.id, 'lease_owner': _OWNER}, {'$set': {
+        'lease_until': lease_until,
+    }})
+
+    # Importer's entity must not overwrite the lease with a stale value when it is saved
+    importer.f_set('lease_until', lease_until)
+
+    return bool(r.matched_count)
+
+
+def release(importer: _model.ContentImport):
+    """Release a lease of an importer.
+    """
+    _get_collection().update_one({'_id': importer.id, 'lease_owner': _OWNER}, {'$set': {
+        'lease_owner': None,
+        'lease_until': None,
+    }})
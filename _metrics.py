@@ -0,0 +1,143 @@
+"""PytSite Content Import Plugin Metrics
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import threading as _threading
+from collections import defaultdict as _defaultdict
+from contextlib import contextmanager as _contextmanager
+from time import perf_counter as _perf_counter
+from typing import Iterable as _Iterable, List as _List, Mapping as _Mapping, Optional as _Optional
+from pytsite import reg as _reg
+from plugins import odm as _odm
+
+STAGES = ('fetch', 'parse', 'dedup', 'transform', 'build', 'images', 'save', 'events')
+
+_current = _threading.local()
+
+
+class Run:
+    """Metrics of a single importer run.
+    """
+
+    def __init__(self):
+        """Init.
+        """
+        self._started = _perf_counter()
+        self.stages = _defaultdict(float)
+        self.counters = _defaultdict(int)
+
+    @property
+    def elapsed(self) -> float:
+        """Get number of seconds since run start.
+        """
+        return _perf_counter() - self._started
+
+
+def get_current() -> _Optional[Run]:
+    """Get the run which is measured in the current thread.
+    """
+    return getattr(_current, 'run', None)
+
+
+@_contextmanager
+def measure():
+    """Measure a run in the current thread.
+    """
+    run = _current.run = Run()
+    try:
+        yield run
+    finally:
+        _current.run = None
+
+
+@_contextmanager
+def stage(name: str):
+    """Measure a stage of the current run.
+    """
+    started = _perf_counter()
+    try:
+        yield
+    finally:
+        run = get_current()
+        if run:
+            run.stages[name] += _perf_counter() - started
+
+
+def count(name: str, value: int = 1):
+    """Increment a counter of the current run.
+    """
+    run = get_current()
+    if run:
+        run.counters[name] += value
+
+
+def percentile(values: _List[float], q: float) -> float:
+    """Get a percentile of values.
+    """
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+
+    return values[min(int(round(q * (len(values) - 1))), len(values) - 1)]
+
+
+def update_stats(stats: _Mapping, run: Run, items: int) -> dict:
+    """Add run's metrics to importer's rolling stats.
+    """
+    window = _reg.get('content_import.stats_window', 50)
+
+    def push(values: _Iterable, value) -> list:
+        return (list(values) + [value])[-window:]
+
+    durations = push(stats.get('durations', ()), run.elapsed)
+    items_counts = push(stats.get('items', ()), items)
+    bytes_counts = push(stats.get('bytes', ()), run.counters['bytes'])
+    stages = {s: push(stats.get('stages', {}).get(s, ()), run.stages[s]) for s in STAGES}
+
+    return {
+        'durations': durations,
+        'items': items_counts,
+        'bytes': bytes_counts,
+        'stages': stages,
+        'p50': percentile(durations, 0.5),
+        'p95': percentile(durations, 0.95),
+        'items_per_sec': sum(items_counts) / sum(durations) if sum(durations) else 0.0,
+        'items_per_run': sum(items_counts) / len(items_counts),
+        'bytes_per_run': sum(bytes_counts) / len(bytes_counts),
+    }
+
+
+def export(importers: _Iterable[_odm.model.Entity]) -> str:
+    """Export importers' stats in Prometheus text format.
+    """
+    lines = {
+        'run_seconds': ['# TYPE content_import_run_seconds summary'],
+        'stage_seconds': ['# TYPE content_import_stage_seconds summary'],
+        'items_per_second': ['# TYPE content_import_items_per_second gauge'],
+        'bytes_per_run': ['# TYPE content_import_bytes_per_run gauge'],
+        'errors': ['# TYPE content_import_errors gauge'],
+    }
+
+    for importer in importers:
+        stats = dict(importer.stats)
+        stats.setdefault('stages', {})
+        labels = 'importer="{}",driver="{}"'.format(importer.id, importer.driver)
+
+        for q in 0.5, 0.95:
+            lines['run_seconds'].append('content_import_run_seconds{{{},quantile="{}"}} {:.6f}'.format(
+                labels, q, percentile(list(stats.get('durations', ())), q)))
+
+            for s in STAGES:
+                lines['stage_seconds'].append('content_import_stage_seconds{{{},stage="{}",quantile="{}"}} {:.6f}'
+                                              .format(labels, s, q, percentile(list(stats['stages'].get(s, ())), q)))
+
+        lines['items_per_second'].append('content_import_items_per_second{{{}}} {:.6f}'.format(
+            labels, stats.get('items_per_sec', 0.0)))
+        lines['bytes_per_run'].append('content_import_bytes_per_run{{{}}} {:.0f}'.format(
+            labels, stats.get('bytes_per_run', 0)))
+        lines['errors'].append('content_import_errors{{{}}} {}'.format(labels, importer.errors or 0))
+
+    return '\n'.join(line for group in lines.values() for line in group) + '\n'
@@ -0,0 +1,79 @@
+"""PytSite Content Import Plugin Data Migrations
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import re as _re
+from typing import Tuple as _Tuple
+from pymongo import UpdateOne as _UpdateOne
+from pymongo.errors import BulkWriteError as _BulkWriteError
+from pytsite import logger as _logger, reg as _reg
+from plugins import odm as _odm
+from . import _api
+
+_VERSION_RE = _re.compile(r'(\d+)\.(\d+)')
+
+
+def parse_version(version) -> _Tuple[int, int]:
+    """Get major and minor numbers of a version.
+    """
+    match = _VERSION_RE.match(str(version))
+
+    return (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+
+
+def link_hashes() -> int:
+    """Store hashes of source links of content which was imported before links hashing was introduced.
+
+    Entities are processed by batches. Returns number of updated entities. Content which duplicates already hashed one
+    is left as is.
+    """
+    batch_size = _reg.get('content_import.migration_batch_size', 1000)
+
+    updated = 0
+    for model in _odm.find('content_import').distinct('content_model'):
+        collection = _odm.dispense(model).collection
+        query = {
+            'content_import.source_link': {'$type': 'string'},
+            'content_import.source_link_hash': {'$exists': False},
+        }
+
+        model_updated = 0
+        last_id = None
+        while True:
+            if last_id:
+                query['_id'] = {'$gt': last_id}
+
+            docs = list(collection.find(query, {'content_import.source_link': True, 'language': True})
+                        .sort('_id', _odm.I_ASC).limit(batch_size))
+            if not docs:
+                break
+
+            last_id = docs[-1]['_id']
+
+            hashes = {}
+            for doc in docs:
+                h = _api.link_hash(doc['content_import']['source_link'], doc.get('language'))
+                hashes.setdefault(h, doc['_id'])
+
+            # Hashes may be already taken by content imported after links hashing was introduced
+            taken = collection.find({'content_import.source_link_hash': {'$in': list(hashes)}},
+                                    {'content_import.source_link_hash': True})
+            for doc in taken:
+                hashes.pop(doc['content_import']['source_link_hash'], None)
+
+            if not hashes:
+                continue
+
+            try:
+                r = collection.bulk_write([_UpdateOne({'_id': e_id}, {'$set': {'content_import.source_link_hash': h}})
+                                           for h, e_id in hashes.items()], ordered=False)
+                model_updated += r.modified_count
+            except _BulkWriteError as e:
+                model_updated += e.details.get('nModified', 0)
+
+        updated += model_updated
+        _logger.info("Source link hashes of {} '{}' entities stored".format(model_updated, model))
+
+    return updated
@@ -4,7 +4,11 @@ __author__ = 'Oleksandr Shepetko'
 __email__ = 'a@shepetko.com'
 __license__ = 'MIT'
 
+import threading as _threading
 from datetime import datetime as _datetime
+from functools import lru_cache as _lru_cache
+from typing import Any as _Any, Dict as _Dict, Optional as _Optional, Tuple as _Tuple
+from bson import DBRef as _DBRef, ObjectId as _ObjectId
 from frozendict import frozendict as _frozendict
 from pytsite import util as _util, router as _router, lang as _lang, errors as _errors, events as _events
 from plugins import odm as _odm, auth as _auth, content as _content, section as _section, auth_ui as _auth_ui, \
@@ -13,6 +17,35 @@ from plugins import odm as _odm, auth as _auth, content as _content, section as
 from . import _widget as _content_import_widget, _api
 
 
+_browser_data = _threading.local()
+_BROWSER_SORT_FIELD = 'driver'
+
+
+@_lru_cache()
+def _get_model_title(model: str, language: str) -> str:
+    """Get content model's title.
+    """
+    return _content.get_model_title(model)
+
+
+@_lru_cache()
+def _get_driver_description(driver: str, language: str) -> str:
+    """Get driver's description.
+    """
+    return _api.get_driver(driver).get_description()
+
+
+def _ref_uid(value: _Any) -> _Optional[str]:
+    """Get entity's UID from a stored reference.
+    """
+    if isinstance(value, _DBRef):
+        return str(value.id)
+    elif isinstance(value, _ObjectId):
+        return str(value)
+    elif isinstance(value, str) and value:
+        return value.split(':')[-1]
+
+
 class ContentImport(_odm_ui.model.UIEntity):
     """PytSite Content Import ODM Model.
     """
@@ -23,6 +56,11 @@ class ContentImport(_odm_ui.model.UIEntity):
         self.define_field(_file_storage_odm.field.Image('logo'))
         self.define_field(_odm.field.String('description'))
         self.define_field(_odm.field.Dict('driver_opts'))
+        self.define_field(_odm.field.Dict('driver_state'))
+        self.define_field(_odm.field.Dict('checkpoint'))
+        self.define_field(_odm.field.Dict('failed_items'))
+        self.define_field(_odm.field.Dict('websub'))
+        self.define_field(_odm.field.Dict('backfill'))
         self.define_field(_odm.field.String('content_model', required=True))
         self.define_field(_auth_storage_odm.field.User('owner', required=True))
         self.define_field(_auth_storage_odm.field.User('content_author', required=True))
@@ -34,6 +72,19 @@ class ContentImport(_odm_ui.model.UIEntity):
         self.define_field(_odm.field.String('last_error'))
         self.define_field(_odm.field.DateTime('paused_till'))
         self.define_field(_odm.field.List('add_tags'))
+        self.define_field(_odm.field.String('near_duplicates', default='keep'))
+        self.define_field(_odm.field.String('lease_owner'))
+        self.define_field(_odm.field.DateTime('lease_until'))
+        self.define_field(_odm.field.DateTime('next_run_at'))
+        self.define_field(_odm.field.DateTime('priority_at'))
+        self.define_field(_odm.field.Integer('poll_interval'))
+        self.define_field(_odm.field.Dict('stats'))
+
+    def _setup_indexes(self):
+        """Hook.
+        """
+        self.define_index([('enabled', _odm.I_ASC), ('next_run_at', _odm.I_ASC), ('errors', _odm.I_ASC)])
+        self.define_index([('enabled', _odm.I_ASC), ('priority_at', _odm.I_ASC), ('errors', _odm.I_ASC)])
 
     def _pre_save(self, **kwargs):
         super()._pre_save(**kwargs)
@@ -53,6 +104,26 @@ class ContentImport(_odm_ui.model.UIEntity):
     def driver_opts(self) -> _frozendict:
         return self.f_get('driver_opts')
 
+    @property
+    def driver_state(self) -> _frozendict:
+        return self.f_get('driver_state')
+
+    @property
+    def checkpoint(self) -> _frozendict:
+        return self.f_get('checkpoint')
+
+    @property
+    def failed_items(self) -> _frozendict:
+        return self.f_get('failed_items')
+
+    @property
+    def websub(self) -> _frozendict:
+        return self.f_get('websub')
+
+    @property
+    def backfill(self) -> _frozendict:
+        return self.f_get('backfill')
+
     @property
     def content_model(self) -> str:
         return self.f_get('content_model')
@@ -93,10 +164,38 @@ class ContentImport(_odm_ui.model.UIEntity):
     def paused_till(self) -> _datetime:
         return self.f_get('paused_till')
 
+    @property
+    def lease_owner(self) -> str:
+        return self.f_get('lease_owner')
+
+    @property
+    def lease_until(self) -> _datetime:
+        return self.f_get('lease_until')
+
+    @property
+    def next_run_at(self) -> _datetime:
+        return self.f_get('next_run_at')
+
+    @property
+    def priority_at(self) -> _datetime:
+        return self.f_get('priority_at')
+
+    @property
+    def poll_interval(self) -> int:
+        return self.f_get('poll_interval')
+
+    @property
+    def stats(self) -> _frozendict:
+        return self.f_get('stats')
+
     @property
     def add_tags(self) -> tuple:
         return self.f_get('add_tags')
 
+    @property
+    def near_duplicates(self) -> str:
+        return self.f_get('near_duplicates')
+
     @property
     def logo(self) -> _file.model.AbstractImage:
         return self.f_get('logo')
@@ -106,8 +205,8 @@ class ContentImport(_odm_ui.model.UIEntity):
         """Hook.
         :type browser: odm_ui._browser.Browser
         """
-        browser.default_sort_field = 'driver'
-        browser.finder_adjust = lambda f: f.eq('content_language', _lang.get_current())
+        browser.default_sort_field = _BROWSER_SORT_FIELD
+        browser.finder_adjust = cls._odm_ui_browser_finder_adjust
         browser.data_fields = [
             ('content_model', 'content_import@content_model'),
             ('driver', 'content_import@driver'),
@@ -117,14 +216,73 @@ class ContentImport(_odm_ui.model.UIEntity):
             ('enabled', 'content_import@enabled'),
             ('errors', 'content_import@errors'),
             ('paused_till', 'content_import@paused_till'),
+            ('stats.p95', 'content_import@stats'),
         ]
 
+    @staticmethod
+    def _odm_ui_browser_finder_adjust(finder: _odm.Finder):
+        """Adjust browser's finder and remember it to prefetch data of the browsed page.
+        """
+        finder.eq('content_language', _lang.get_current())
+
+        _browser_data.finder_request = _router.request()
+        _browser_data.finder = finder
+
+    def _odm_ui_browser_prefetch(self) -> _Dict[str, _Tuple[str, str]]:
+        """Resolve authors and sections of the browsed page's importers in bulk, once per request.
+
+        Rows which are not prefetched, e. g. if the page is sorted differently, are resolved one by one.
+        """
+        request = _router.request()
+        if getattr(_browser_data, 'request', None) is request:
+            return _browser_data.rows
+
+        _browser_data.request = request
+        _browser_data.rows = {}
+
+        if getattr(_browser_data, 'finder_request', None) is not request:
+            return _browser_data.rows
+
+        # Importers of the browsed page
+        inp = request.inp
+        f = _browser_data.finder.clone().skip(int(inp.get('offset', 0)))
+        f.sort([(inp.get('sort') or _BROWSER_SORT_FIELD, _odm.I_DESC if inp.get('order') == 'desc' else _odm.I_ASC)])
+        ids = [_ObjectId(e.id) for e in f.get(int(inp.get('limit', 10)))]
+
+        refs = {}
+        for doc in self.collection.find({'_id': {'$in': ids}}, {'content_author': True, 'content_section': True}):
+            refs[str(doc['_id'])] = (_ref_uid(doc.get('content_author')), _ref_uid(doc.get('content_section')))
+
+        user_ids = [_ObjectId(a) for a, s in refs.values() if a]
+        section_ids = [_ObjectId(s) for a, s in refs.values() if s]
+
+        # Names are built the same way as users' first_last_name, but from entities loaded by a single query
+        users = {}
+        if user_ids:
+            for user in _odm.find('user').inc('_id', user_ids).get():
+                users[str(user.id)] = '{} {}'.format(user.f_get('first_name'), user.f_get('last_name')).strip()
+
+        sections = {}
+        if section_ids:
+            for section in _odm.find('section').inc('_id', section_ids).get():
+                sections[str(section.id)] = section.title
+
+        _browser_data.rows = {uid: (users.get(a, ''), sections.get(s, '&nbsp;')) for uid, (a, s) in refs.items()}
+
+        return _browser_data.rows
+
     def odm_ui_browser_row(self) -> tuple:
-        model = _content.get_model_title(self.content_model)
-        driver = _api.get_driver(self.driver).get_description()
+        language = _lang.get_current()
+        model = _get_model_title(self.content_model, language)
+        driver = _get_driver_description(self.driver, language)
         driver_options = str(dict(self.driver_opts))
-        content_section = self.content_section.title if self.content_section else '&nbsp;'
-        content_author = self.content_author.first_last_name
+
+        prefetched = self._odm_ui_browser_prefetch().get(str(self.id))
+        if prefetched:
+            content_author, content_section = prefetched
+        else:
+            content_section = self.content_section.title if self.content_section else '&nbsp;'
+            content_author = self.content_author.first_last_name
         enabled = '<span class="label label-success">' + self.t('word_yes') + '</span>' if self.enabled else ''
         paused_till = self.f_get('paused_till', fmt='pretty_date_time') if _datetime.now() < self.paused_till else ''
 
@@ -134,7 +292,13 @@ class ContentImport(_odm_ui.model.UIEntity):
         else:
             errors = ''
 
-        return model, driver, driver_options, content_section, content_author, enabled, errors, paused_till
+        if self.stats:
+            stats = '<span title="p50: {:.2f}s">p95: {:.2f}s</span>, {:.2f}/s, {:.0f} KB'.format(
+                self.stats['p50'], self.stats['p95'], self.stats['items_per_sec'], self.stats['bytes_per_run'] / 1024)
+        else:
+            stats = ''
+
+        return model, driver, driver_options, content_section, content_author, enabled, errors, paused_till, stats
 
     def odm_ui_m_form_setup(self, frm: _form.Form):
         """Hook.
@@ -221,6 +385,16 @@ class ContentImport(_odm_ui.model.UIEntity):
                 value=self.add_tags,
             ))
 
+            frm.add_widget(_widget.select.Select(
+                weight=95,
+                uid='near_duplicates',
+                label=self.t('near_duplicates'),
+                value=self.near_duplicates,
+                items=[(k, self.t('near_duplicates_' + k)) for k in ('keep', 'skip', 'merge')],
+                h_size='col-sm-4',
+                append_none_item=False,
+            ))
+
             frm.add_widget(_widget.select.DateTime(
                 weight=100,
                 uid='paused_till',
@@ -264,6 +438,67 @@ class ContentImport(_odm_ui.model.UIEntity):
 
             driver_opts[w.uid.replace('driver_opts_', '')] = w.value
 
+        # Driver's state and checkpoint are not valid anymore for changed options
+        if driver_opts != dict(self.driver_opts):
+            self.f_set('driver_state', {})
+            self.f_set('checkpoint', {})
+            self.f_set('failed_items', {})
+
+            # Importer is polled again, so its subscription is updated according to the new source
+            websub = dict(self.websub)
+            websub.pop('renew_at', None)
+            self.f_set('websub', websub)
+
         self.f_set('driver_opts', driver_opts)
 
         super().odm_ui_m_form_submit(frm)
+
+
+class QueuedItem(_odm.model.Entity):
+    """Item which waits to be saved by the save stage of the queue pipeline.
+    """
+    def _setup_fields(self):
+        """Hook.
+        """
+        self.define_field(_odm.field.String('importer_uid', required=True))
+        self.define_field(_odm.field.String('key', required=True))
+        self.define_field(_odm.field.Dict('data'))
+        self.define_field(_odm.field.Integer('attempts'))
+        self.define_field(_odm.field.DateTime('next_attempt_at'))
+        self.define_field(_odm.field.DateTime('lease_until'))
+        self.define_field(_odm.field.Bool('failed'))
+        self.define_field(_odm.field.String('last_error'))
+
+    def _setup_indexes(self):
+        """Hook.
+        """
+        self.define_index([('failed', _odm.I_ASC), ('next_attempt_at', _odm.I_ASC)])
+        self.define_index([('importer_uid', _odm.I_ASC), ('key', _odm.I_ASC)])
+
+    @property
+    def importer_uid(self) -> str:
+        return self.f_get('importer_uid')
+
+    @property
+    def key(self) -> str:
+        return self.f_get('key')
+
+    @property
+    def data(self) -> _frozendict:
+        return self.f_get('data')
+
+    @property
+    def attempts(self) -> int:
+        return self.f_get('attempts')
+
+    @property
+    def next_attempt_at(self) -> _datetime:
+        return self.f_get('next_attempt_at')
+
+    @property
+    def failed(self) -> bool:
+        return self.f_get('failed')
+
+    @property
+    def last_error(self) -> str:
+        return self.f_get('last_error')
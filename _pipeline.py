@@ -0,0 +1,524 @@
+"""PytSite Content Import Plugin Import Pipeline
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import threading as _threading
+from hashlib import sha1 as _sha1
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from datetime import datetime as _datetime, timedelta as _timedelta
+from time import monotonic as _monotonic
+from typing import Callable as _Callable, Dict as _Dict, List as _List, Optional as _Optional, Tuple as _Tuple
+from frozendict import frozendict as _frozendict
+from pytsite import logger as _logger, reg as _reg, events as _events
+from plugins import content as _content
+from . import _api, _error, _model, _driver, _cache, _http, _images, _lease, _metrics, _fingerprint, _queue, \
+    _throttle, _websub
+
+_locks = {}  # type: _Dict[str, _threading.Lock]
+_locks_lock = _threading.Lock()
+_executor = None  # type: _Optional[_ThreadPoolExecutor]
+_workers_active = 0
+
+
+def _get_executor() -> _ThreadPoolExecutor:
+    """Get the pool which runs importers concurrently.
+    """
+    global _executor
+
+    with _locks_lock:
+        if not _executor:
+            _executor = _ThreadPoolExecutor(_reg.get('content_import.workers', 1), 'content_import')
+
+    return _executor
+
+
+def _lock(importer: _model.ContentImport) -> bool:
+    """Try to lock an importer, return False if it is already locked.
+    """
+    with _locks_lock:
+        lock = _locks.setdefault(importer.ref, _threading.Lock())
+
+    return lock.acquire(False)
+
+
+def _unlock(importer: _model.ContentImport):
+    """Unlock an importer.
+    """
+    _locks[importer.ref].release()
+
+
+def _work(deadline_at: float) -> int:
+    """Claim and run importers one by one until there are no more available ones or the tick's time is over.
+
+    Returns number of importers which were run.
+    """
+    # Importer is not started if it cannot make significant progress within the tick
+    min_remaining = _reg.get('content_import.tick_min_remaining', 5)
+
+    n = 0
+    while _monotonic() + min_remaining < deadline_at:
+        importer = _lease.claim()
+        if not importer:
+            break
+
+        # Importer's lease has expired, but it is still running in this process
+        if not _lock(importer):
+            _logger.warn("Content import '{}' is still working".format(importer.ref))
+            continue
+
+        try:
+            with _http.deadline(at=deadline_at):
+                _import(importer)
+            n += 1
+        finally:
+            _lease.release(importer)
+            _unlock(importer)
+
+    return n
+
+
+def _save_queued(q_items: _List[_model.QueuedItem], deadline_at: float):
+    """Build and save entities from a batch of queued items of the same importer.
+
+    Items are deduplicated by a single query and saved entities are announced by a single event.
+    """
+    importer = _api.get_importer(q_items[0].importer_uid)
+    if not importer:
+        for q_item in q_items:
+            _queue.done(q_item)
+        return
+
+    items = [_queue.get_item(q_item) for q_item in q_items]
+    q_items_by_item = {id(item): q_item for item, q_item in zip(items, q_items)}
+
+    driver = _api.get_driver(importer.driver)
+    try:
+        with _http.deadline(at=deadline_at):
+            pairs = driver.build_item_entities(items, _frozendict(get_options(importer)))
+
+        errors = []
+        save(importer, driver, [entity for item, entity in pairs], errors)
+
+    # Tick's time is over, items will be processed on next tick
+    except _error.DeadlineExceeded:
+        for q_item in q_items:
+            _queue.release(q_item)
+        return
+
+    except Exception as e:
+        _logger.error("Error while saving queued items of content import '{}'. {}".format(importer.ref, e))
+        for q_item in q_items:
+            _queue.retry(q_item, e)
+        return
+
+    # Entities which failed to save are tried again later
+    failed = {id(entity): e for entity, e in errors}
+    for item, entity in pairs:
+        if id(entity) in failed:
+            _queue.retry(q_items_by_item.pop(id(item)), failed[id(entity)])
+
+    # Rest of items were either saved or dropped as duplicates
+    for q_item in q_items_by_item.values():
+        _queue.done(q_item)
+
+
+def _consume(deadline_at: float) -> int:
+    """Save queued items by batches until there are no more available ones or the tick's time is over.
+
+    Returns number of items which were processed.
+    """
+    min_remaining = _reg.get('content_import.tick_min_remaining', 5)
+    batch_size = _reg.get('content_import.save_batch_size', 10)
+
+    n = 0
+    while _monotonic() + min_remaining < deadline_at:
+        q_items = _queue.claim_batch(batch_size)
+        if not q_items:
+            break
+
+        _save_queued(q_items, deadline_at)
+        n += len(q_items)
+
+    return n
+
+
+def _run_worker(stage: _Callable[[float], int], deadline_at: float):
+    """Run a stage worker started by cron.
+    """
+    global _workers_active
+
+    try:
+        stage(deadline_at)
+
+    # Nobody waits for the worker's result, so its errors are only logged
+    except Exception as e:
+        _logger.error('Content import worker failed. {}'.format(e), exc_info=e)
+
+    finally:
+        with _locks_lock:
+            _workers_active -= 1
+
+
+def work(stage: str, deadline_at: float) -> int:
+    """Run a stage of the pipeline in the current thread till the deadline.
+
+    Stage is 'fetch' or 'save', returns number of processed importers or items.
+    """
+    return (_work if stage == 'fetch' else _consume)(deadline_at)
+
+
+def _reschedule(importer: _model.ContentImport, items_imported: int, exhausted: bool):
+    """Schedule next run of an importer according to its source's publishing rate.
+    """
+    min_interval = _reg.get('content_import.poll_interval_min', 60)
+    max_interval = _reg.get('content_import.poll_interval_max', 3600)
+    interval = importer.poll_interval or min_interval
+
+    if not exhausted:
+        # Source still has new items
+        interval = min_interval
+    elif items_imported:
+        # Source is busy, poll it faster
+        interval /= 2
+    else:
+        # Source is quiet, back off
+        interval *= _reg.get('content_import.poll_interval_backoff', 1.5)
+
+    interval = int(min(max(interval, min_interval), max_interval))
+    next_run_at = _datetime.now() + _timedelta(seconds=interval)
+    importer.f_set('poll_interval', interval)
+    importer.f_set('next_run_at', next_run_at)
+
+    # Productive sources are prioritized over quiet ones, but bonus is limited, so every source is run in bounded time
+    bonus = min((importer.stats or {}).get('items_per_run', 0) * _reg.get('content_import.yield_bonus', 10),
+                _reg.get('content_import.yield_bonus_max', 300))
+    importer.f_set('priority_at', next_run_at - _timedelta(seconds=bonus))
+
+
+def _carry_over(importer: _model.ContentImport):
+    """Schedule an importer which was interrupted to continue on next tick, ahead of others.
+    """
+    importer.f_set('next_run_at', _datetime.now())
+    if not importer.priority_at:
+        importer.f_set('priority_at', _datetime.now())
+
+
+def _record_duplicate(original: _content.model.Content, duplicate: _content.model.Content, merge: bool):
+    """Record link of a near-duplicate in the original entity, so the near-duplicate is found by deduplication.
+    """
+    link_hash = duplicate.f_get('content_import').get('source_link_hash')
+    link_hashes = list(original.f_get('content_import').get('duplicate_link_hashes', ()))
+    if not link_hash or link_hash in link_hashes:
+        return
+
+    original.f_add('content_import', {'duplicate_link_hashes': link_hashes + [link_hash]})
+    if merge and original.has_field('ext_links'):
+        original.f_add('ext_links', duplicate.f_get('content_import')['source_link'])
+
+    original.save()
+
+
+def save(importer: _model.ContentImport, driver: _driver.Abstract, entities: _List[_content.model.Content],
+         errors: list = None) -> _Tuple[int, int]:
+    """Save a batch of entities and notify listeners, return numbers of successfully saved and failed entities.
+
+    Failed entities along with their errors are appended to `errors` list if it is specified.
+    """
+    saved = []
+    failed = 0
+    for entity in entities:
+        try:
+            # Near-duplicate of an entity imported from another source
+            if importer.near_duplicates in ('skip', 'merge'):
+                original = _fingerprint.find_similar(entity)
+                if original:
+                    _record_duplicate(original, entity, importer.near_duplicates == 'merge')
+
+                    if entity.has_field('images'):
+                        _images.discard(entity.images)
+
+                    _logger.info("Near-duplicate of '{}' skipped: '{}'".format(original.title, entity.title))
+                    continue
+
+            # Append additional tags
+            if entity.has_field('tags'):
+                for tag_title in importer.add_tags:
+                    entity.f_add('tags', _cache.get_tag(tag_title, importer.content_language))
+
+            # Save entity
+            with _metrics.stage('save'):
+                entity.save()
+
+            # Images are owned by the saved entity now
+            if entity.has_field('images'):
+                _images.commit(entity.images)
+
+            # Notify listeners
+            with _metrics.stage('events'):
+                _events.fire('content_import@import', driver=driver, entity=entity)
+
+            _logger.info("Content entity imported: '{}'".format(entity.f_get('title')))
+            saved.append(entity)
+
+        # Entity was not successfully saved; make record in the log and skip to the next entity
+        except Exception as e:
+            # Delete already attached images to free space
+            if entity.has_field('images') and entity.images:
+                _images.discard(entity.images)
+
+            _logger.error("Error while creating entity '{}'. {}".format(entity.title, str(e)), exc_info=e)
+            failed += 1
+            if errors is not None:
+                errors.append((entity, e))
+
+    # Notify listeners which process entities together
+    if saved:
+        with _metrics.stage('events'):
+            _events.fire('content_import@import_batch', driver=driver, entities=saved)
+
+    return len(saved), failed
+
+
+def _track_failures(importer: _model.ContentImport, entities: _List[_content.model.Content]) -> bool:
+    """Count attempts to import entities which failed to save, return True if some of them should be retried.
+
+    Entities which failed too many times are given up, so they do not block importer's checkpoint and state forever.
+    """
+    max_attempts = _reg.get('content_import.max_item_attempts', 3)
+
+    attempts = {}
+    for entity in entities:
+        data = entity.f_get('content_import')
+        key = data.get('source_link_hash') or _sha1(str(data.get('source_guid') or entity.title).encode()).hexdigest()
+        attempts[key] = importer.failed_items.get(key, 0) + 1
+        if attempts[key] >= max_attempts:
+            _logger.warn("Content entity '{}' failed to import {} times, given up".format(entity.title, attempts[key]))
+
+    # Items which were not failed this time are either imported or given up
+    importer.f_set('failed_items', attempts)
+
+    return any(n < max_attempts for n in attempts.values())
+
+
+def get_options(importer: _model.ContentImport, driver_opts: dict = None) -> dict:
+    """Get driver's options of an importer.
+    """
+    options = dict(importer.driver_opts if driver_opts is None else driver_opts)
+    options.update({
+        'content_author': importer.content_author,
+        'content_model': importer.content_model,
+        'content_language': importer.content_language,
+        'content_status': importer.content_status,
+        'content_section': importer.content_section,
+    })
+
+    return options
+
+
+def _import(importer: _model.ContentImport, push_body: bytes = None) -> bool:
+    """Import content using an importer, return False if the import was not completed.
+    """
+    with _metrics.measure() as run:
+        items_imported, completed = _do_import(importer, push_body)
+
+    importer.f_set('stats', _metrics.update_stats(importer.stats, run, items_imported))
+    importer.save()
+
+    # Importers of feeds which support WebSub receive new content by push
+    if push_body is None:
+        _websub.maintain(importer)
+
+    return completed
+
+
+def _do_import(importer: _model.ContentImport, push_body: bytes = None) -> _Tuple[int, bool]:
+    """Import content using an importer, return number of imported entities and whether the import was completed.
+
+    If `push_body` is specified, content pushed by a WebSub hub is imported instead of polling the source.
+    """
+    max_errors = _reg.get('content_import.max_errors', 13)
+    max_items = _reg.get('content_import.max_items', 10)
+    delay_errors = _reg.get('content_import.delay_errors', 120)
+    delay_errors_base = _reg.get('content_import.delay_errors_base', 1)
+    batch_size = _reg.get('content_import.save_batch_size', 10)
+
+    options = get_options(importer)
+    options.update({
+        'checkpoint': importer.checkpoint,
+        'max_items': max_items,
+    })
+
+    # Pushed content contains only new items and cannot be read again, so it is imported completely
+    if push_body is not None:
+        options.update({'push_body': push_body, 'max_items': None})
+        max_items = None
+
+    driver_state = dict(importer.driver_state)
+    batch = []
+    errors = []
+    items_imported = 0
+    items_failed = 0
+    exhausted = True
+    try:
+        driver = _api.get_driver(importer.driver)
+        _logger.info('Content import started. Driver: {}. Options: {}'.format(driver.get_name(), options))
+
+        if _reg.get('content_import.pipeline', 'inline') == 'queue' and not _driver.is_legacy(driver):
+            # New items are only queued, so the whole source is read; entities are built and saved by the save stage
+            options['max_items'] = None
+            for items in driver.get_new_items(_frozendict(options), driver_state):
+                items_imported += _queue.put(importer, items)
+
+        else:
+            # Drivers which implement only get_entities(options) build and check entities themselves
+            if _driver.is_legacy(driver):
+                entities = driver.get_entities(_frozendict(options))
+            else:
+                entities = driver.get_entities(_frozendict(options), driver_state)
+
+            # Get entities from driver and save them by batches
+            for entity in entities:
+                if items_imported == max_items:
+                    if entity.has_field('images'):
+                        _images.discard(entity.images)
+                    exhausted = False
+                    break
+
+                batch.append(entity)
+                if len(batch) == batch_size or items_imported + len(batch) == max_items:
+                    saved, failed = save(importer, driver, batch, errors)
+                    items_imported += saved
+                    items_failed += failed
+                    batch = []
+
+            if batch:
+                saved, failed = save(importer, driver, batch, errors)
+                items_imported += saved
+                items_failed += failed
+                batch = []
+
+        # Mark that driver made its work without errors
+        importer.f_set('errors', 0)
+
+        # Pushed content does not affect polling
+        if push_body is not None:
+            _logger.info('Pushed content import finished. Entities imported: {}.'.format(items_imported))
+            return items_imported, not items_failed
+
+        # Driver stopped building entities before the end of the source
+        if driver_state.pop('truncated', False):
+            exhausted = False
+
+        # Failed entities are retried by next runs several times
+        retry = _track_failures(importer, [entity for entity, e in errors])
+
+        # Checkpoint may advance only if all the source's entities were saved or given up, otherwise failed ones would
+        # be skipped
+        checkpoint = driver_state.pop('checkpoint', None)
+        if checkpoint and exhausted and not retry:
+            importer.f_set('checkpoint', checkpoint)
+
+        # Driver's state may be stored only if all the source's entities were processed, otherwise rest of them
+        # would be skipped on next run
+        if exhausted and not retry:
+            importer.f_set('driver_state', driver_state)
+
+        _reschedule(importer, items_imported, exhausted)
+
+        _logger.info('Content import finished. Entities imported: {}.'.format(items_imported))
+
+    except Exception as e:
+        # Delete images of entities which will not be saved
+        for entity in batch:
+            if entity.has_field('images'):
+                _images.discard(entity.images)
+
+        # Tick's time is over, rest of the source will be imported on next tick
+        if isinstance(e, _error.DeadlineExceeded):
+            _carry_over(importer)
+            _logger.warn('Content import interrupted. Entities imported: {}. {}'.format(items_imported, e))
+            return items_imported, False
+
+        # Source's host is failing, so the importer waits for it without counting errors
+        if isinstance(e, _error.CircuitOpen):
+            importer.f_set('paused_till', _datetime.now() + _timedelta(seconds=e.retry_in))
+            _logger.warn('Content import paused. {}'.format(e))
+            return items_imported, False
+
+        # Increment errors counter
+        importer.f_inc('errors')
+
+        # Store info about error
+        importer.f_set('last_error', str(e))
+
+        if importer.errors >= max_errors:
+            # Disable if maximum errors count reached
+            importer.f_set('enabled', False)
+        else:
+            # Pause importer for exponentially growing period
+            delay = _throttle.backoff(importer.errors, delay_errors_base * 60, delay_errors * 60)
+            importer.f_set('paused_till', _datetime.now() + _timedelta(seconds=delay))
+
+        _logger.error(e)
+
+        return items_imported, False
+
+    return items_imported, True
+
+
+def push(importer: _model.ContentImport, body: bytes) -> bool:
+    """Import content pushed by a WebSub hub.
+
+    Returns False if the importer is busy or pushed content was not imported completely, so the hub should deliver it
+    again. Already imported items of a redelivered content are skipped as duplicates.
+    """
+    # Importer may be run by another node or worker right now
+    leased = _lease.acquire(importer)
+    if not leased:
+        return False
+
+    try:
+        if not _lock(leased):
+            return False
+
+        try:
+            # Hub waits for the response, so the import is limited in time as well as cron ticks
+            with _http.deadline(_reg.get('content_import.push_budget', 20)):
+                return _import(leased, body)
+        finally:
+            _unlock(leased)
+
+    finally:
+        _lease.release(leased)
+
+
+def tick():
+    """Run a cron tick of the pipeline.
+    """
+    global _workers_active
+
+    workers = _reg.get('content_import.workers', 1)
+    deadline_at = _monotonic() + _reg.get('content_import.tick_budget', 50)
+
+    # Sections and tags lookups are shared by importers within a tick, and optionally across ticks
+    if not _reg.get('content_import.lookup_cache_persistent', False):
+        _cache.clear()
+
+    # Importers and queued items are claimed through leases, so they are distributed among all nodes and workers
+    stages = [_work]
+    if _reg.get('content_import.pipeline', 'inline') == 'queue' and _reg.get('content_import.queue_cron_save', True):
+        stages.append(_consume)
+
+    if workers > 1:
+        with _locks_lock:
+            to_start = workers - _workers_active
+            _workers_active += max(to_start, 0)
+
+        # Workers are distributed among stages evenly
+        for i in range(to_start):
+            _get_executor().submit(_run_worker, stages[i % len(stages)], deadline_at)
+    else:
+        for stage in stages:
+            stage(deadline_at)
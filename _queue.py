@@ -0,0 +1,136 @@
+"""PytSite Content Import Plugin Items Queue
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+from hashlib import sha1 as _sha1
+from datetime import datetime as _datetime, timedelta as _timedelta
+from typing import List as _List, Optional as _Optional
+from pymongo import ReturnDocument as _ReturnDocument
+from pymongo.collection import Collection as _Collection
+from pytsite import reg as _reg
+from plugins import odm as _odm
+from . import _api, _driver, _model, _throttle
+
+_MODEL = 'content_import_item'
+
+
+def _get_collection() -> _Collection:
+    """Get collection of the queue.
+    """
+    return _odm.dispense(_MODEL).collection
+
+
+def _get_key(item: _driver.Item, language: str) -> str:
+    """Get key which identifies an item within its importer.
+    """
+    if item.link:
+        return _api.link_hash(item.link, language)
+
+    return _sha1('{} {}'.format(language, item.guid or item.title).encode('utf-8')).hexdigest()
+
+
+def put(importer: _model.ContentImport, items: _List[_driver.Item]) -> int:
+    """Put importer's items to the queue, return number of newly queued items.
+    """
+    keys = {_get_key(item, importer.content_language): item for item in items}
+
+    # Items may be still queued by previous runs
+    queued = set(_odm.find(_MODEL).eq('importer_uid', importer.id).inc('key', list(keys)).distinct('key'))
+
+    now = _datetime.now()
+    for key, item in keys.items():
+        if key in queued:
+            continue
+
+        q_item = _odm.dispense(_MODEL)
+        q_item.f_set('importer_uid', importer.id)
+        q_item.f_set('key', key)
+        q_item.f_set('data', item.as_dict())
+        q_item.f_set('attempts', 0)
+        q_item.f_set('next_attempt_at', now)
+        q_item.f_set('failed', False)
+        q_item.save()
+
+    return len(keys) - len(queued)
+
+
+def claim(importer_uid: str = None) -> _Optional[_model.QueuedItem]:
+    """Atomically claim an item which is due to be saved and is not leased by anyone.
+    """
+    now = _datetime.now()
+    query = {
+        'failed': False,
+        'next_attempt_at': {'$lt': now},
+        '$or': [{'lease_until': {'$lt': now}}, {'lease_until': None}],
+    }
+    if importer_uid:
+        query['importer_uid'] = importer_uid
+
+    doc = _get_collection().find_one_and_update(
+        query,
+        {'$set': {
+            'lease_until': now + _timedelta(seconds=_reg.get('content_import.lease_ttl', 600)),
+        }},
+        projection={'_id': True},
+        sort=[('next_attempt_at', _odm.I_ASC)],
+        return_document=_ReturnDocument.AFTER,
+    )
+
+    return _odm.dispense(_MODEL, str(doc['_id'])) if doc else None
+
+
+def claim_batch(limit: int) -> _List[_model.QueuedItem]:
+    """Claim up to `limit` items of the same importer, so they are built and saved together.
+    """
+    q_item = claim()
+    if not q_item:
+        return []
+
+    batch = [q_item]
+    while len(batch) < limit:
+        q_item = claim(batch[0].importer_uid)
+        if not q_item:
+            break
+        batch.append(q_item)
+
+    return batch
+
+
+def get_item(q_item: _model.QueuedItem) -> _driver.Item:
+    """Get driver's item from a queued one.
+    """
+    return _driver.Item.from_dict(q_item.data)
+
+
+def done(q_item: _model.QueuedItem):
+    """Remove an item which was processed.
+    """
+    q_item.delete()
+
+
+def release(q_item: _model.QueuedItem):
+    """Release an item to be processed again without counting an attempt.
+    """
+    q_item.f_set('lease_until', None)
+    q_item.save()
+
+
+def retry(q_item: _model.QueuedItem, error: Exception):
+    """Schedule another attempt to process an item with exponential backoff.
+
+    Items which have failed too many times are kept in the queue marked as failed.
+    """
+    attempts = q_item.attempts + 1
+    delay = _throttle.backoff(attempts, _reg.get('content_import.queue_retry_delay', 60),
+                              _reg.get('content_import.queue_retry_delay_max', 86400))
+
+    q_item.f_set('attempts', attempts)
+    q_item.f_set('last_error', str(error))
+    q_item.f_set('lease_until', None)
+    q_item.f_set('next_attempt_at', _datetime.now() + _timedelta(seconds=delay))
+    if attempts >= _reg.get('content_import.queue_max_attempts', 5):
+        q_item.f_set('failed', True)
+
+    q_item.save()
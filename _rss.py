@@ -0,0 +1,55 @@
+"""PytSite Content Import Plugin RSS Driver
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+from xml.etree import ElementTree as _ElementTree
+from pytsite import lang as _lang
+from . import _driver, _feed
+
+_FULL_TEXT_TAGS = (
+    '{https://pytsite.xyz}fullText',
+    '{http://purl.org/rss/1.0/modules/content}encoded',
+    '{http://news.yandex.ru}full-text',
+)
+
+
+class RSS(_feed.XMLFeed):
+    """RSS Content Import Driver.
+    """
+    _item_tag = 'item'
+
+    def get_name(self) -> str:
+        """Get name of the driver.
+        """
+        return 'rss'
+
+    def get_description(self) -> str:
+        """Get the human readable description of the driver.
+        """
+        return _lang.t('content_import@rss')
+
+    def _get_item(self, rss_item: _ElementTree.Element) -> _driver.Item:
+        """Convert an RSS item element to an item.
+        """
+        body = None
+        for tag in _FULL_TEXT_TAGS:
+            body = rss_item.findtext(tag)
+            if body:
+                break
+
+        return _driver.Item(
+            guid=rss_item.findtext('guid'),
+            link=rss_item.findtext('link'),
+            title=rss_item.findtext('title'),
+            pub_date=rss_item.findtext('pubDate'),
+            pub_ts=_feed.get_timestamp(rss_item.findtext('pubDate')),
+            description=rss_item.findtext('description'),
+            body=body,
+            author=rss_item.findtext('author'),
+            categories=[c.text for c in rss_item.findall('category') if c.text],
+            tags=[t.text for t in rss_item.findall('{https://pytsite.xyz}tag') if t.text],
+            video_links=_feed.get_video_links(rss_item),
+            enclosures=[(e.get('url'), e.get('type')) for e in rss_item.findall('enclosure') if e.get('url')],
+        )
@@ -0,0 +1,189 @@
+"""PytSite Content Import Plugin Outbound Requests Throttling
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import threading as _threading
+from random import uniform as _uniform
+from time import monotonic as _monotonic, sleep as _sleep
+from typing import Dict as _Dict, Optional as _Optional, Set as _Set
+from urllib.parse import urlparse as _urlparse
+from pytsite import reg as _reg
+from . import _error
+
+_buckets = {}  # type: _Dict[str, TokenBucket]
+_breakers = {}  # type: _Dict[str, CircuitBreaker]
+_exempt = set()  # type: _Set[str]
+_lock = _threading.Lock()
+
+
+def backoff(attempt: int, base: float, max_delay: float) -> float:
+    """Get exponential delay with jitter before an attempt.
+
+    Delay is randomized within its upper half, so retries of many clients are spread in time.
+    """
+    delay = min(base * 2 ** max(attempt - 1, 0), max_delay)
+
+    return delay / 2 + _uniform(0, delay / 2)
+
+
+class TokenBucket:
+    """Token bucket rate limiter shared by several threads.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """Init.
+
+        `rate` is a number of tokens added per second, zero means no limit.
+        """
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = _monotonic()
+        self._lock = _threading.Lock()
+
+    def _reserve(self, n: int) -> float:
+        """Take tokens, return number of seconds to wait until they are available.
+        """
+        with self._lock:
+            now = _monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= n
+
+            return -self._tokens / self._rate if self._tokens < 0 else 0.0
+
+    def wait(self, n: int = 1, deadline_at: float = None):
+        """Wait until tokens are available.
+        """
+        if self._rate <= 0:
+            return
+
+        delay = self._reserve(n)
+        if deadline_at is not None and _monotonic() + delay > deadline_at:
+            # Tokens are not used, so they are returned back
+            with self._lock:
+                self._tokens += n
+            raise _error.DeadlineExceeded('Time budget is exhausted while waiting for rate limit')
+
+        if delay:
+            _sleep(delay)
+
+
+class CircuitBreaker:
+    """Circuit breaker which stops requests to a failing host for increasing periods.
+    """
+
+    def __init__(self, threshold: int, base: float, max_delay: float):
+        """Init.
+        """
+        self._threshold = threshold
+        self._base = base
+        self._max_delay = max_delay
+        self._failures = 0
+        self._opens = 0
+        self._open_until = 0.0
+        self._lock = _threading.Lock()
+
+    def check(self, name: str):
+        """Raise an error if the circuit is open.
+        """
+        retry_in = self._open_until - _monotonic()
+        if retry_in > 0:
+            raise _error.CircuitOpen("Requests to '{}' are suspended".format(name), retry_in)
+
+    def success(self):
+        """Register a successful request.
+        """
+        with self._lock:
+            self._failures = self._opens = 0
+
+    def failure(self, retry_after: float = None):
+        """Register a failed request.
+
+        After the circuit is open once, the first failure after the delay opens it again for a longer period.
+        """
+        with self._lock:
+            self._failures += 1
+            if self._failures < self._threshold and not retry_after:
+                return
+
+            self._opens += 1
+            delay = backoff(self._opens, self._base, self._max_delay)
+            self._open_until = _monotonic() + max(delay, retry_after or 0)
+
+
+def get_domain(url: str) -> str:
+    """Get domain which is used to throttle requests to an URL.
+
+    Domains are the same as 'content_import.source_domain' of imported entities.
+    """
+    return _urlparse(url)[1]
+
+
+def _get_bucket(domain: str) -> TokenBucket:
+    """Get rate limiter of a domain.
+    """
+    with _lock:
+        if domain not in _buckets:
+            _buckets[domain] = TokenBucket(_reg.get('content_import.domain_rate', 2),
+                                           _reg.get('content_import.domain_burst', 5))
+
+        return _buckets[domain]
+
+
+def _get_breaker(domain: str) -> CircuitBreaker:
+    """Get circuit breaker of a domain.
+    """
+    with _lock:
+        if domain not in _breakers:
+            _breakers[domain] = CircuitBreaker(_reg.get('content_import.breaker_threshold', 5),
+                                               _reg.get('content_import.breaker_delay', 30),
+                                               _reg.get('content_import.breaker_delay_max', 3600))
+
+        return _breakers[domain]
+
+
+def exempt(domain: str, value: bool = True):
+    """Exempt a domain from throttling or cancel the exemption.
+    """
+    with _lock:
+        if value:
+            _exempt.add(domain)
+        else:
+            _exempt.discard(domain)
+
+
+def acquire(url: str, deadline_at: float = None):
+    """Wait until a request to an URL is allowed.
+    """
+    domain = get_domain(url)
+    if domain in _exempt:
+        return
+
+    _get_breaker(domain).check(domain)
+    _get_bucket(domain).wait(1, deadline_at)
+
+
+def success(url: str):
+    """Register a successful request to an URL.
+    """
+    domain = get_domain(url)
+    if domain not in _exempt:
+        _get_breaker(domain).success()
+
+
+def failure(url: str, retry_after: _Optional[str] = None):
+    """Register a failed request to an URL.
+
+    `retry_after` is a value of the 'Retry-After' response header.
+    """
+    try:
+        retry_after = float(retry_after) if retry_after else None
+    except ValueError:
+        retry_after = None
+
+    domain = get_domain(url)
+    if domain not in _exempt:
+        _get_breaker(domain).failure(retry_after)
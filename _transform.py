@@ -0,0 +1,123 @@
+"""PytSite Content Import Plugin Items Transformation
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import re as _re
+import threading as _threading
+import multiprocessing as _multiprocessing
+from datetime import datetime as _datetime
+from multiprocessing.pool import Pool as _Pool
+from typing import List as _List, Optional as _Optional
+from pytsite import reg as _reg, util as _util, validation as _validation, logger as _logger
+from . import _fingerprint
+
+_AUTHOR_RE = _re.compile(r'(\S+)\s+\((.+?)\)')
+_TITLE_MAX_LENGTH = 100
+
+_pool = None  # type: _Optional[_Pool]
+_pool_closed = False
+_lock = _threading.Lock()
+
+
+def _get_publish_time(pub_date: _Optional[str]) -> _datetime:
+    """Get publish time of an item.
+
+    Items without valid publish date are considered published when they are fetched.
+    """
+    if pub_date:
+        try:
+            return _util.parse_date_time(pub_date)
+        except (ValueError, OverflowError):
+            pass
+
+    return _datetime.now()
+
+
+def _get_title(text: str) -> _Optional[str]:
+    """Make a title of an item which has none from its text.
+    """
+    text = ' '.join(text.split())
+    if len(text) <= _TITLE_MAX_LENGTH:
+        return text or None
+
+    return text[:_TITLE_MAX_LENGTH].rsplit(' ', 1)[0] + '…'
+
+
+def transform(raw: dict) -> dict:
+    """Transform raw item's data.
+
+    This function is CPU-bound and may be run in a separate process, so it returns only derived values.
+    """
+    description = _util.strip_html_tags(raw['description']) if raw['description'] is not None else None
+
+    r = {
+        'title': raw['title'] or _get_title(description or _util.strip_html_tags(raw['body'] or '')),
+        'publish_time': _get_publish_time(raw['pub_date']),
+        'description': description,
+        'has_images': bool(raw['body']) and '<img' in raw['body'],
+        'author_email': None,
+        'author_name': None,
+        'fingerprint': _fingerprint.get(raw['title'], raw['description'] or raw['body']),
+    }
+
+    # Author in 'email (name)' format; other values, e. g. 'name (organization)', are kept as the source author only
+    match = _AUTHOR_RE.match(raw['author'] or '')
+    if match:
+        try:
+            r['author_email'] = _validation.rule.Email(match.group(1)).validate()
+            r['author_name'] = match.group(2)
+        except _validation.error.RuleError:
+            pass
+
+    return r
+
+
+def _get_pool(processes: int) -> _Pool:
+    """Get the pool of transformation processes.
+
+    Forking of a multi-threaded process is not safe, so processes are started by a fork server or spawned.
+    """
+    global _pool
+
+    with _lock:
+        if not _pool:
+            method = _reg.get('content_import.transform_start_method', 'forkserver')
+            _pool = _multiprocessing.get_context(method).Pool(processes)
+
+    return _pool
+
+
+def _close_pool():
+    """Terminate the pool of transformation processes, so it is not used anymore by the current process.
+    """
+    global _pool, _pool_closed
+
+    with _lock:
+        if _pool:
+            _pool.terminate()
+        _pool = None
+        _pool_closed = True
+
+
+def transform_many(raws: _List[dict]) -> _List[dict]:
+    """Transform raw data of several items, in parallel processes if it is enabled.
+    """
+    processes = _reg.get('content_import.transform_processes', 0)
+    if processes < 1 or len(raws) < 2 or _pool_closed:
+        return [transform(raw) for raw in raws]
+
+    # Pool's processes may be unable to even start, e. g. if the plugin cannot be imported by them, in which case the
+    # pool respawns them forever without completing any task
+    try:
+        return _get_pool(processes).map_async(transform, raws).get(_reg.get('content_import.transform_timeout', 30))
+
+    except _multiprocessing.TimeoutError:
+        _logger.error('Transformation processes do not respond, items are transformed inline from now on')
+        _close_pool()
+
+    except Exception as e:
+        _logger.error('Error in transformation processes, items are transformed inline. {}'.format(e))
+
+    return [transform(raw) for raw in raws]
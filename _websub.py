@@ -0,0 +1,136 @@
+"""PytSite Content Import Plugin WebSub Subscriptions
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import hmac as _hmac
+from secrets import token_hex as _token_hex
+from datetime import datetime as _datetime, timedelta as _timedelta
+from pytsite import reg as _reg, router as _router, logger as _logger
+from . import _model, _http
+
+
+def get_callback_url(importer: _model.ContentImport) -> str:
+    """Get URL which receives hub's requests for an importer.
+    """
+    return _router.rule_url('content_import@websub', {'uid': importer.id})
+
+
+def _request(importer: _model.ContentImport, mode: str, hub: str, topic: str, secret: str = None):
+    """Send a subscription request to a hub.
+    """
+    data = {
+        'hub.mode': mode,
+        'hub.topic': topic,
+        'hub.callback': get_callback_url(importer),
+    }
+
+    if mode == 'subscribe':
+        data['hub.lease_seconds'] = _reg.get('content_import.websub_lease', 864000)
+        data['hub.secret'] = secret
+
+    _http.post(hub, data).raise_for_status()
+
+
+def _set(importer: _model.ContentImport, ws: dict):
+    """Store importer's subscription.
+    """
+    importer.f_set('websub', ws)
+    importer.save()
+
+
+def maintain(importer: _model.ContentImport):
+    """Subscribe, renew or cancel importer's subscription according to the hub advertised by its feed.
+
+    Hub verifies requests concurrently, so subscription is stored before the request is sent.
+    """
+    ws = dict(importer.websub or {})
+    hub, topic = importer.driver_state.get('websub_hub'), importer.driver_state.get('websub_self')
+    now = _datetime.now()
+
+    try:
+        # Feed does not support WebSub anymore
+        if not (_reg.get('content_import.websub', False) and hub and topic):
+            if ws.get('hub'):
+                _set(importer, {})
+                _request(importer, 'unsubscribe', ws['hub'], ws['topic'])
+            return
+
+        if ws.get('hub') == hub and ws.get('topic') == topic:
+            # Subscription is active and its lease is not going to expire soon
+            if ws.get('renew_at') and ws['renew_at'] > now:
+                return
+
+            # Subscription is still waiting for verification by the hub
+            verify_timeout = _timedelta(seconds=_reg.get('content_import.websub_verify_timeout', 3600))
+            if ws.get('requested_at') and ws['requested_at'] > now - verify_timeout:
+                return
+
+        # Feed has moved to another hub or topic
+        elif ws.get('hub'):
+            _set(importer, {})
+            _request(importer, 'unsubscribe', ws['hub'], ws['topic'])
+            ws = {}
+
+        ws.update({
+            'hub': hub,
+            'topic': topic,
+            'secret': ws.get('secret') or _token_hex(20),
+            'requested_at': now,
+        })
+        _set(importer, ws)
+        _request(importer, 'subscribe', hub, topic, ws['secret'])
+
+    except Exception as e:
+        _logger.warn("WebSub subscription of content import '{}' failed. {}".format(importer.ref, e))
+
+
+def verify(importer: _model.ContentImport, mode: str, topic: str, lease_seconds: str = None) -> bool:
+    """Handle hub's verification of intent, return True if it is confirmed.
+    """
+    ws = dict(importer.websub or {})
+    now = _datetime.now()
+
+    if mode == 'subscribe':
+        if not ws.get('requested_at') or ws.get('topic') != topic:
+            return False
+
+        # Subscription is renewed some time before its lease expires
+        lease = int(lease_seconds or _reg.get('content_import.websub_lease', 864000))
+        margin = min(_reg.get('content_import.websub_renew_margin', 3600), lease // 2)
+        ws.update({
+            'requested_at': None,
+            'lease_until': now + _timedelta(seconds=lease),
+            'renew_at': now + _timedelta(seconds=lease - margin),
+        })
+
+    elif mode == 'unsubscribe':
+        # Only subscriptions which are not used anymore can be cancelled
+        return ws.get('topic') != topic
+
+    elif mode == 'denied':
+        if ws.get('topic') != topic:
+            return True
+        ws = {}
+
+    else:
+        return False
+
+    _set(importer, ws)
+
+    return True
+
+
+def check_signature(importer: _model.ContentImport, body: bytes, signature: str) -> bool:
+    """Check signature of content pushed by a hub.
+    """
+    secret = (importer.websub or {}).get('secret')
+    if not (secret and signature and '=' in signature):
+        return False
+
+    method, digest = signature.split('=', 1)
+    if method not in ('sha1', 'sha256', 'sha384', 'sha512'):
+        return False
+
+    return _hmac.compare_digest(_hmac.new(secret.encode(), body, method).hexdigest(), digest)